@@ -1,11 +1,14 @@
 from fastapi import Depends, HTTPException, APIRouter, status
 from fastapi_jwt_auth import AuthJWT
+from starlette.concurrency import run_in_threadpool
 from fastapi_jwt_auth.exceptions import JWTDecodeError, InvalidHeaderError, MissingTokenError
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from models import User
 from database import get_db
-from dependencies import get_password_hash, verify_password
+from dependencies import get_password_hash_async, verify_password_async
+from service.user_cache import user_cache
+from service.metrics import timed
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 
@@ -42,29 +45,34 @@ class LoginRequest(BaseModel):
     password: str
 
 @auth_router.post("/register", response_model=UserResponse)
-def register(request: RegisterRequest, db: Session = Depends(get_db)):
+async def register(request: RegisterRequest, db: Session = Depends(get_db)):
     try:
-        hashed_password = get_password_hash(request.password)
+        hashed_password = await get_password_hash_async(request.password)
         user = User(username = request.username, email = request.email, password = hashed_password)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+
+        def save():
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+
+        # The session is synchronous: keep its I/O on the threadpool, off the event loop.
+        await run_in_threadpool(save)
         return user
     except IntegrityError:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username or Email already exists.")
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred during registration: {str(e)}"
         )
 
 @auth_router.post("/login")
-def login(request: LoginRequest, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
+async def login(request: LoginRequest, db: Session = Depends(get_db), Authorize: AuthJWT = Depends()):
     try:
-        user = db.query(User).filter(User.username == request.username).first()
-        if user == None or not verify_password(request.password, user.password):
+        user = await run_in_threadpool(lambda: db.query(User).filter(User.username == request.username).first())
+        if user == None or not await verify_password_async(request.password, user.password):
             raise HTTPException(status_code=401, detail="Invalid username or password")
         else:
             access_token = Authorize.create_access_token(subject=user.username)
@@ -102,12 +110,19 @@ def refresh_token(Authorize: AuthJWT = Depends(), db: Session = Depends(get_db))
 
 def get_current_user(Authorize: AuthJWT = Depends(), db: Session = Depends(get_db)):
     try:
-        Authorize.jwt_required()
-        current_user = Authorize.get_jwt_subject()
-        user = db.query(User).filter(User.username == current_user).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid user")
-        return user
+        with timed("auth"):
+            Authorize.jwt_required()
+            current_user = Authorize.get_jwt_subject()
+            user = user_cache.get(current_user)
+            if user is not None:
+                return user
+            user = db.query(User).filter(User.username == current_user).first()
+            if not user:
+                raise HTTPException(status_code=401, detail="Invalid user")
+            # Detach before the route commits, so the cached copy keeps its loaded attributes.
+            db.expunge(user)
+            user_cache.set(current_user, user)
+            return user
     except MissingTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,40 @@
+import random
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "tu", "sa", "vel", "do", "ri", "nax", "pe", "zor", "qui", "ban", "to", "lix"]
+
+
+class CorpusGenerator:
+    """Seeded generator of collections, documents and questions made of pseudo-words.
+
+    Every document draws most of its words from its own topic vocabulary, so a
+    question built from a document's topic retrieves paragraphs of that document.
+    """
+
+    def __init__(self, seed=0, vocabulary_size=5000, topic_size=50):
+        self.random = random.Random(seed)
+        self.vocabulary = sorted({self._word() for _ in range(vocabulary_size)})
+        self.topic_size = topic_size
+
+    def _word(self):
+        return "".join(self.random.choice(SYLLABLES) for _ in range(self.random.randint(1, 4)))
+
+    def topic(self):
+        return self.random.sample(self.vocabulary, self.topic_size)
+
+    def sentence(self, topic, words=12):
+        picked = [self.random.choice(topic) if self.random.random() < 0.8 else self.random.choice(self.vocabulary) for _ in range(words)]
+        return " ".join(picked).capitalize() + "."
+
+    def paragraph(self, topic, sentences=5):
+        return " ".join(self.sentence(topic, self.random.randint(8, 20)) for _ in range(sentences))
+
+    def collection(self, index):
+        return {"name": f"bench-collection-{index}", "description": " ".join(self.random.sample(self.vocabulary, 8))}
+
+    def document(self, index, paragraphs=6):
+        topic = self.topic()
+        content = "\n".join(self.paragraph(topic, self.random.randint(3, 7)) for _ in range(paragraphs))
+        return {"title": f"bench-document-{index}", "content": content}, topic
+
+    def question(self, topic, words=8):
+        return " ".join(self.random.sample(topic, words)) + "?"
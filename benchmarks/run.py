@@ -0,0 +1,277 @@
+"""Offline end-to-end benchmark of the API.
+
+The app runs in-process behind httpx's ASGI transport, against a throwaway
+SQLite database, with an in-memory vector store, hashing embeddings and a
+sleeping LLM stand-in (see ``benchmarks/stubs.py``), so no network, model
+weights or Pinecone key are needed. Results are written as JSON; pass a
+previous result file to ``--compare`` to fail on latency regressions.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare bench.json
+"""
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+import numpy as np
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--collections", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=200, help="documents ingested in total")
+    parser.add_argument("--paragraphs", type=int, default=6, help="paragraphs per document")
+    parser.add_argument("--ingest-concurrency", type=int, default=4)
+    parser.add_argument("--chat-concurrency", default="1,4,16", help="comma separated concurrency levels")
+    parser.add_argument("--chat-requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--history-sizes", default="500,5000,20000", help="comma separated history row counts, including the rows added by the chat runs")
+    parser.add_argument("--history-requests", type=int, default=50, help="requests per history size")
+    parser.add_argument("--llm-prefill-ms", type=float, default=50)
+    parser.add_argument("--llm-token-ms", type=float, default=20)
+    parser.add_argument("--llm-answer-tokens", type=int, default=32)
+    parser.add_argument("--llm-workers", type=int, default=1)
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline result file; exit 1 if a p95 latency regresses")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 increase for --compare")
+    return parser.parse_args(argv)
+
+
+def configure_environment(workdir):
+    # Must run before the app modules are imported: they read their settings at import time.
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["LEXICAL_INDEX_PATH"] = os.path.join(workdir, "lexical_index.db")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("DEFAULT_ANSWER", "The information is not available in the context.")
+
+
+def summarize(latencies, elapsed, errors=0):
+    latencies_ms = np.asarray(latencies) * 1000
+    summary = {"requests": len(latencies) + errors, "errors": errors, "elapsed_s": round(elapsed, 3)}
+    summary["throughput_rps"] = round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    if len(latencies_ms):
+        for name, q in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)):
+            summary[name] = round(float(np.percentile(latencies_ms, q)), 2)
+        summary["mean_ms"] = round(float(latencies_ms.mean()), 2)
+        summary["max_ms"] = round(float(latencies_ms.max()), 2)
+    return summary
+
+
+async def run_concurrently(count, concurrency, request):
+    """Call ``request(i)`` for ``i`` in ``range(count)`` from ``concurrency`` workers; returns (latencies, errors, elapsed, results)."""
+    latencies, results = [], []
+    errors = 0
+    next_index = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            start = perf_counter()
+            response = await request(i)
+            elapsed = perf_counter() - start
+            if response.status_code >= 400:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            results.append(response)
+
+    start = perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors, perf_counter() - start, results
+
+
+async def login(client):
+    credentials = {"username": "bench", "password": "bench-password"}
+    await client.post("/auth/register", json={**credentials, "email": "bench@example.com"})
+    response = await client.post("/auth/login", json=credentials)
+    response.raise_for_status()
+    body = response.json()
+    return {"Authorization": f"Bearer {body['access_token']}"}, body["user"]["id"]
+
+
+async def bench_ingest(client, headers, corpus, args):
+    collection_ids = []
+    for i in range(args.collections):
+        response = await client.post("/collections/create", json=corpus.collection(i), headers=headers)
+        response.raise_for_status()
+        collection_ids.append(response.json()["id"])
+
+    documents = [corpus.document(i, args.paragraphs) for i in range(args.documents)]
+    topics = {collection_id: [] for collection_id in collection_ids}
+    for i, (_, topic) in enumerate(documents):
+        topics[collection_ids[i % len(collection_ids)]].append(topic)
+
+    async def create(i):
+        collection_id = collection_ids[i % len(collection_ids)]
+        return await client.post(f"/collections/{collection_id}/documents/create", json=documents[i][0], headers=headers)
+
+    latencies, errors, elapsed, results = await run_concurrently(len(documents), args.ingest_concurrency, create)
+    chunks = sum(len(response.json().get("chunk_hashes") or []) for response in results)
+    summary = summarize(latencies, elapsed, errors)
+    summary["concurrency"] = args.ingest_concurrency
+    summary["chunks"] = chunks
+    summary["documents_per_second"] = round(len(results) / elapsed, 2) if elapsed else 0.0
+    summary["chunks_per_second"] = round(chunks / elapsed, 2) if elapsed else 0.0
+    return summary, topics
+
+
+async def bench_chat(client, headers, corpus, topics, args):
+    pool = [(collection_id, topic) for collection_id, collection_topics in topics.items() for topic in collection_topics]
+    results = {}
+    for concurrency in [int(level) for level in args.chat_concurrency.split(",")]:
+        questions = [corpus.random.choice(pool) for _ in range(args.chat_requests)]
+
+        async def ask(i):
+            collection_id, topic = questions[i]
+            return await client.post("/chat/query", json={"query": corpus.question(topic), "collection_ids": [collection_id]}, headers=headers)
+
+        latencies, errors, elapsed, responses = await run_concurrently(args.chat_requests, concurrency, ask)
+        # Answers without sources skipped the LLM, which would make the latencies meaningless.
+        answered = sum(1 for response in responses if response.json()["source_data"])
+        results[f"concurrency_{concurrency}"] = {"concurrency": concurrency, "answered": answered, **summarize(latencies, elapsed, errors)}
+    return results
+
+
+def grow_history(user_id, collection_ids, size, corpus):
+    """Insert history rows directly until the user has ``size`` of them; returns the row in the middle."""
+    from database import SessionLocal
+    from models import History, HistoryCollection
+
+    db = SessionLocal()
+    try:
+        existing = db.query(History).filter(History.user_id == user_id).count()
+        rows = []
+        for i in range(existing, size):
+            collection_id = collection_ids[i % len(collection_ids)]
+            topic = corpus.topic()
+            rows.append(History(
+                user_id=user_id,
+                query=corpus.question(topic),
+                collection_ids=[collection_id],
+                bot_response=corpus.paragraph(topic),
+                collection_links=[HistoryCollection(collection_id=collection_id)],
+            ))
+        db.add_all(rows)
+        db.commit()
+        return db.query(History).filter(History.user_id == user_id).order_by(History.created_at.desc(), History.id.desc()).offset(size // 2).first()
+    finally:
+        db.close()
+
+
+async def bench_history(client, headers, user_id, collection_ids, corpus, args):
+    from router.chat import encode_history_cursor
+
+    results = {}
+    for size in [int(size) for size in args.history_sizes.split(",")]:
+        middle = await asyncio.to_thread(grow_history, user_id, collection_ids, size, corpus)
+        pages = {
+            "first_page": {"limit": 50},
+            "summary_page": {"limit": 50, "view": "summary"},
+            "middle_page": {"limit": 50, "cursor": encode_history_cursor(middle)},
+            "collection_filter": {"limit": 50, "collection_id": collection_ids[0]},
+        }
+        results[f"rows_{size}"] = {}
+        for name, params in pages.items():
+            async def page(i):
+                return await client.get("/chat/history", params=params, headers=headers)
+
+            latencies, errors, elapsed, _ = await run_concurrently(args.history_requests, 1, page)
+            results[f"rows_{size}"][name] = summarize(latencies, elapsed, errors)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    import httpx
+    from database import Base, engine
+    from main import app
+    from benchmarks import stubs
+    from benchmarks.data import CorpusGenerator
+
+    stubs.install(args.llm_prefill_ms, args.llm_token_ms, args.llm_answer_tokens, args.llm_workers)
+    Base.metadata.create_all(bind=engine)
+    corpus = CorpusGenerator(args.seed)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        headers, user_id = await login(client)
+        ingest, topics = await bench_ingest(client, headers, corpus, args)
+        chat = await bench_chat(client, headers, corpus, topics, args)
+        history = await bench_history(client, headers, user_id, list(topics), corpus, args)
+    engine.dispose()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": vars(args),
+        },
+        "ingest": ingest,
+        "chat": chat,
+        "history": history,
+    }
+
+
+def latency_entries(results, path=()):
+    """Yield ``(path, p95_ms)`` for every summary in a result tree."""
+    for key, value in results.items():
+        if key == "meta" or not isinstance(value, dict):
+            continue
+        if "p95_ms" in value:
+            yield "/".join(path + (key,)), value["p95_ms"]
+        else:
+            yield from latency_entries(value, path + (key,))
+
+
+def compare(results, baseline, tolerance):
+    """Print p95 changes against ``baseline``; returns the names of the regressed measurements."""
+    previous = dict(latency_entries(baseline))
+    regressions = []
+    for name, p95 in latency_entries(results):
+        if name not in previous:
+            continue
+        change = (p95 - previous[name]) / previous[name] if previous[name] else 0.0
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<45} p95 {previous[name]:>9.2f} ms -> {p95:>9.2f} ms ({change:+.1%}){'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        configure_environment(workdir)
+        results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
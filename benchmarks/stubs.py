@@ -0,0 +1,191 @@
+from service.vector_store import DIMENSION, VectorStore
+from time import perf_counter
+import asyncio
+import re
+import threading
+import zlib
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\S+")
+VOCAB_SIZE = 32000
+BOS_TOKEN_ID = 1
+EOS_TOKEN_ID = 2
+
+
+def _token_id(token):
+    return zlib.crc32(token.encode()) % (VOCAB_SIZE - 3) + 3
+
+
+class WhitespaceTokenizer:
+    """Stands in for both the MiniLM and the Llama tokenizer: one token per whitespace-separated word."""
+
+    pad_token_id = EOS_TOKEN_ID
+    eos_token_id = EOS_TOKEN_ID
+
+    def _encode(self, text, add_special_tokens, return_offsets_mapping):
+        matches = list(TOKEN_PATTERN.finditer(text))
+        input_ids = [_token_id(match.group()) for match in matches]
+        offsets = [match.span() for match in matches]
+        if add_special_tokens:
+            input_ids.insert(0, BOS_TOKEN_ID)
+            offsets.insert(0, (0, 0))
+        encoded = {"input_ids": input_ids}
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = offsets
+        return encoded
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, **kwargs):
+        if isinstance(text, str):
+            return self._encode(text, add_special_tokens, return_offsets_mapping)
+        encoded = [self._encode(t, add_special_tokens, return_offsets_mapping) for t in text]
+        return {key: [e[key] for e in encoded] for key in (encoded[0] if encoded else {"input_ids": []})}
+
+
+class HashingEmbeddingModel:
+    """Deterministic bag-of-words embeddings with the MiniLM interface used by ``EmbeddingService``.
+
+    Texts that share words get a higher cosine similarity, so synthetic queries
+    built from a document's vocabulary retrieve that document.
+    """
+
+    def __init__(self, dimension=DIMENSION):
+        self.dimension = dimension
+        self.tokenizer = WhitespaceTokenizer()
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in TOKEN_PATTERN.findall(text.lower()):
+                h = zlib.crc32(word.encode())
+                embeddings[row, h % self.dimension] += 1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.where(norms == 0, 1, norms)
+        return embeddings[0] if single else embeddings
+
+
+class InMemoryVectorStore(VectorStore):
+    """Brute-force cosine search over per-collection dicts; nothing leaves the process."""
+
+    multi_collection_query = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections = {}
+
+    def create_collection(self, collection_id):
+        with self._lock:
+            self._collections.setdefault(collection_id, {})
+
+    def delete_collection(self, collection_id):
+        with self._lock:
+            self._collections.pop(collection_id, None)
+
+    def upsert(self, collection_id, vectors):
+        with self._lock:
+            rows = self._collections.setdefault(collection_id, {})
+            for vector in vectors:
+                values = np.asarray(vector["values"], dtype=np.float32)
+                norm = np.linalg.norm(values)
+                rows[vector["id"]] = (vector["metadata"]["document_id"], values / norm if norm else values, vector["metadata"])
+
+    def delete_document(self, collection_id, document_id):
+        with self._lock:
+            rows = self._collections.get(collection_id, {})
+            for vector_id in [vector_id for vector_id, row in rows.items() if row[0] == document_id]:
+                del rows[vector_id]
+
+    def delete_vectors(self, collection_id, document_id, ids):
+        with self._lock:
+            rows = self._collections.get(collection_id, {})
+            for vector_id in ids:
+                rows.pop(vector_id, None)
+
+    def update_metadata(self, collection_id, document_id, metadata_by_id):
+        with self._lock:
+            rows = self._collections.get(collection_id, {})
+            for vector_id, metadata in metadata_by_id.items():
+                if vector_id in rows:
+                    row_document_id, values, previous = rows[vector_id]
+                    rows[vector_id] = (row_document_id, values, {**previous, **metadata})
+
+    def _matches(self, collection_ids, vector):
+        query = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            for collection_id in collection_ids:
+                for vector_id, (document_id, values, metadata) in self._collections.get(collection_id, {}).items():
+                    yield collection_id, vector_id, document_id, float(values @ query), metadata
+
+    def query(self, collection_id, vector, top_k=5):
+        return [
+            {key: value for key, value in match.items() if key != "collection_id"}
+            for match in self.query_collections([collection_id], vector, top_k)
+        ]
+
+    def query_collections(self, collection_ids, vector, top_k=5):
+        matches = sorted(self._matches(collection_ids, vector), key=lambda match: match[3], reverse=True)[:top_k]
+        return [
+            {"collection_id": collection_id, "document_id": document_id, "match": {"id": vector_id, "score": score, "metadata": metadata}}
+            for collection_id, vector_id, document_id, score, metadata in matches
+        ]
+
+
+class StubScheduler:
+    """Replaces ``InferenceScheduler``: sleeps for a fixed prefill plus a per-token decode time.
+
+    ``workers`` requests are served at once and the rest queue, like the real
+    scheduler's worker threads. The answer repeats words from the prompt's
+    context so ``finalize_response`` keeps it.
+    """
+
+    def __init__(self, tokenizer, prefill_ms=50, token_ms=20, answer_tokens=32, workers=1):
+        self.tokenizer = tokenizer
+        self.prefill = prefill_ms / 1000
+        self.token_time = token_ms / 1000
+        self.answer_tokens = answer_tokens
+        self.workers = workers
+        self._slots = None
+        self.requests = 0
+
+    async def generate(self, prompt, max_new_tokens, stats=None):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        enqueued = perf_counter()
+        async with self._slots:
+            start = perf_counter()
+            prompt_tokens = len(self.tokenizer(prompt)["input_ids"])
+            await asyncio.sleep(self.prefill)
+            first_token_time = perf_counter()
+            generated_tokens = min(self.answer_tokens, max_new_tokens)
+            await asyncio.sleep(generated_tokens * self.token_time)
+            end = perf_counter()
+        self.requests += 1
+        if stats is not None:
+            stats.update({
+                "queue_wait": start - enqueued,
+                "prefill": first_token_time - start,
+                "decode": end - first_token_time,
+                "prompt_tokens": prompt_tokens,
+                "generated_tokens": generated_tokens,
+            })
+        context = prompt.split("Context:", 1)[-1].split()
+        return " ".join(context[:generated_tokens])
+
+    def stats(self):
+        return {"requests": self.requests, "workers": self.workers}
+
+
+def install(prefill_ms=50, token_ms=20, answer_tokens=32, llm_workers=1):
+    """Swap the app's model and vector store singletons for the stand-ins above."""
+    from service import chatbot_service, pinecone_service, vector_store
+
+    embedding_model = HashingEmbeddingModel()
+    tokenizer = WhitespaceTokenizer()
+    pinecone_service._model = embedding_model
+    vector_store._store = InMemoryVectorStore()
+    chatbot_service._tokenizer = tokenizer
+    chatbot_service._scheduler = StubScheduler(tokenizer, prefill_ms, token_ms, answer_tokens, llm_workers)
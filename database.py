@@ -1,11 +1,99 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ArgumentError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from service.metrics import record
+from dotenv import load_dotenv
+from time import perf_counter
+import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+load_dotenv()
+
+DEFAULT_DATABASE_URL = "sqlite:///./test.db"
+# Value of the old .env.example, from before DATABASE_URL was read.
+DATABASE_URL_PLACEHOLDER = "YOUR_DATABASE_URL"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_SQLITE_MMAP_SIZE = int(os.getenv("DB_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Drivers used when the URL names only the backend, and for the AsyncSession path; all are in requirements.txt.
+SYNC_DRIVERS = {"postgresql": "postgresql+psycopg2", "mysql": "mysql+pymysql"}
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+def database_url(value):
+    if not value or value == DATABASE_URL_PLACEHOLDER:
+        return DEFAULT_DATABASE_URL
+    try:
+        url = make_url(value)
+    except ArgumentError:
+        raise RuntimeError(f"DATABASE_URL is not a valid database URL: {value!r}") from None
+    if url.drivername in SYNC_DRIVERS:
+        url = url.set(drivername=SYNC_DRIVERS[url.drivername])
+    return url.render_as_string(hide_password=False)
+
+def create_engines(url):
+    try:
+        return (
+            create_engine(url, **engine_options(url)),
+            create_async_engine(async_database_url(url), **async_engine_options(url)),
+        )
+    except ModuleNotFoundError as e:
+        raise RuntimeError(f"DATABASE_URL needs the {e.name} driver, which is not installed; pip install -r requirements.txt") from e
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == "sqlite"
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def engine_options(url):
+    options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True}
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_recycle"] = DB_POOL_RECYCLE
+    return options
+
+def async_engine_options(url):
+    options = engine_options(url)
+    if is_sqlite(url):
+        # aiosqlite file databases default to NullPool, which rejects pool sizing.
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; NORMAL sync is safe with WAL.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={DB_SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+SQLALCHEMY_DATABASE_URL = database_url(os.getenv("DATABASE_URL"))
+engine, async_engine = create_engines(SQLALCHEMY_DATABASE_URL)
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    record("db", perf_counter() - conn.info["query_start"].pop())
+
+if is_sqlite(SQLALCHEMY_DATABASE_URL):
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+for sync_engine in (engine, async_engine.sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", start_query_timer)
+    event.listen(sync_engine, "after_cursor_execute", stop_query_timer)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autoflush=False, autocommit = False, bind = engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -14,4 +102,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,58 @@
+"""Multi-worker server: loads the models once in the master, then forks the workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+With ``preload_app`` the app is imported in the master, and ``when_ready``
+loads the LLM and embedding weights there before any worker is forked. The
+workers then share those pages copy-on-write instead of each holding its own
+copy. Nothing may run a forward pass in the master: torch's thread pools do
+not survive ``fork``. Each worker warms up (``WARMUP_ON_STARTUP``) after it
+starts.
+"""
+from dotenv import load_dotenv
+import gc
+import os
+
+load_dotenv()
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Loading a 7B model and warming it up can take minutes.
+timeout = int(os.getenv("WORKER_TIMEOUT", "600"))
+graceful_timeout = 30
+# 0 splits the cores evenly between the workers.
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+
+# The local vector store keeps each collection's rows in process memory and rewrites its
+# sidecar from them, so several workers would serve stale rows and overwrite each other.
+if os.getenv("VECTOR_STORE", "pinecone") == "local" and workers > 1:
+    raise RuntimeError("VECTOR_STORE=local only supports a single worker; set WEB_WORKERS=1 or use a Pinecone backend")
+
+def when_ready(server):
+    from schema import upgrade_schema
+    from service import chatbot_service, pinecone_service
+
+    upgrade_schema()
+    pinecone_service.load()
+    chatbot_service.load()
+    # Keep the loaded objects out of the collector so it doesn't dirty their pages in the workers.
+    gc.collect()
+    gc.freeze()
+    server.log.info("Models loaded in the master, forking workers")
+
+def post_fork(server, worker):
+    import torch
+    from database import engine, async_engine
+
+    torch.set_num_threads(TORCH_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // workers))
+    # Connections opened by the master must not be shared with the children.
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,11 +1,25 @@
 from fastapi import FastAPI
-from database import Base, engine
+from fastapi.responses import JSONResponse, Response
+from schema import upgrade_schema
 from auth import auth_router
 from router import collections, chat
 # from router import collections
 from fastapi.middleware.cors import CORSMiddleware
+from service import chatbot_service, pinecone_service
+from service.metrics import TimingMiddleware, metrics_payload
+from service.ingestion_service import start_job_recovery
+from logging_config import configure_logging
+from dotenv import load_dotenv
+from threading import Thread
+import logging
+import os
 
-Base.metadata.create_all(bind=engine)
+load_dotenv()
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
 
 app = FastAPI()
 
@@ -22,6 +36,44 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Added last so it wraps everything else, including CORS.
+app.add_middleware(TimingMiddleware)
+
 app.include_router(auth_router)
 app.include_router(collections.router)
-app.include_router(chat.router)
\ No newline at end of file
+app.include_router(chat.router)
+
+warmup_state = {"done": False, "error": None}
+
+def warmup_models():
+    try:
+        pinecone_service.warmup()
+        chatbot_service.warmup()
+        warmup_state["done"] = True
+    except Exception as e:
+        warmup_state["error"] = str(e)
+        logger.exception("Warming up the models failed")
+
+@app.on_event("startup")
+def startup():
+    upgrade_schema()
+    start_job_recovery()
+    if WARMUP_ON_STARTUP:
+        Thread(target=warmup_models, name="model-warmup", daemon=True).start()
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    models = {"embedding": pinecone_service.is_loaded(), "llm": chatbot_service.is_loaded()}
+    # Without warmup the models load on first use, so readiness doesn't wait for them.
+    ready = warmup_state["done"] if WARMUP_ON_STARTUP else True
+    body = {"ready": ready, "warmup": WARMUP_ON_STARTUP, "models": models, "error": warmup_state["error"]}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/metrics")
+def metrics():
+    content, media_type = metrics_payload()
+    return Response(content=content, media_type=media_type)
@@ -0,0 +1,131 @@
+"""Copy vectors from the per-collection Pinecone indexes into the shared index layout.
+
+Usage:
+    python migrate_vectors.py [--collections 1 2 3] [--batch-size 100] [--dry-run] [--delete-source]
+    python migrate_vectors.py --reindex-legacy [--collections 1 2 3] [--dry-run]
+
+Every vector of ``collection-{id}`` (including the older one-namespace-per-document
+layout) is fetched in pages and upserted into the shared index used by
+``VECTOR_STORE=pinecone_shared``. Source indexes are only removed with
+``--delete-source``.
+
+``--reindex-legacy`` stays on the per-collection layout (``VECTOR_STORE=pinecone``):
+searches only read the default namespace, so each document still stored in an
+old ``document-{id}`` namespace is re-indexed from the database and that
+namespace is deleted. Namespaces of documents that no longer exist are deleted too.
+"""
+from dotenv import load_dotenv
+from database import SessionLocal
+from models import Collection, Document
+from service.vector_store import VECTOR_STORE, PineconeVectorStore, SharedPineconeVectorStore
+from service.pinecone_service import chunk_hash
+from service.ingestion_service import reindex_document
+import argparse
+
+load_dotenv()
+
+def document_id_for(namespace, metadata):
+    if "document_id" in metadata:
+        return int(metadata["document_id"])
+    if namespace.startswith("document-"):
+        return int(namespace.split("-")[-1])
+    return None
+
+def migrated_vector(vector_id, vector, document_id):
+    metadata = dict(vector.metadata or {})
+    metadata["document_id"] = document_id
+    if not vector_id.startswith(f"{document_id}#"):
+        # Positional ids from the per-document namespaces become content-hash ids.
+        key = chunk_hash(metadata["text"]) if "text" in metadata else vector_id
+        vector_id = f"{document_id}#{key}"
+    return {"id": vector_id, "values": list(vector.values), "metadata": metadata}
+
+def migrate_collection(source, target, collection_id, batch_size, dry_run):
+    index_name = f"collection-{collection_id}"
+    if index_name not in source.pc.list_indexes().names():
+        print(f"Collection {collection_id}: no source index, skipped")
+        return None
+    index = source.pc.Index(index_name)
+    namespaces = list(index.describe_index_stats().get("namespaces", {}).keys())
+    copied = 0
+    for namespace in namespaces:
+        for ids in index.list(namespace=namespace, limit=batch_size):
+            if not ids:
+                continue
+            fetched = index.fetch(ids=ids, namespace=namespace).vectors
+            vectors = []
+            for vector_id, vector in fetched.items():
+                document_id = document_id_for(namespace, vector.metadata or {})
+                if document_id is None:
+                    print(f"Collection {collection_id}: vector {vector_id} has no document id, skipped")
+                    continue
+                vectors.append(migrated_vector(vector_id, vector, document_id))
+            if vectors and not dry_run:
+                target.upsert(collection_id, vectors)
+            copied += len(vectors)
+    print(f"Collection {collection_id}: {copied} vectors {'found' if dry_run else 'copied'}")
+    return copied
+
+def reindex_legacy_collection(source, collection_id, dry_run):
+    index_name = f"collection-{collection_id}"
+    if index_name not in source.pc.list_indexes().names():
+        print(f"Collection {collection_id}: no index, skipped")
+        return 0
+    index = source.pc.Index(index_name)
+    namespaces = [namespace for namespace in index.describe_index_stats().get("namespaces", {}) if namespace.startswith("document-")]
+    reindexed = 0
+    db = SessionLocal()
+    try:
+        for namespace in namespaces:
+            document_id = int(namespace.split("-")[-1])
+            document = db.query(Document).filter(Document.id == document_id, Document.collection_id == collection_id).first()
+            if dry_run:
+                print(f"Collection {collection_id}: {namespace} would be {'re-indexed' if document else 'deleted (no document)'}")
+                continue
+            if document is not None:
+                reindex_document(db, document.id)
+                reindexed += 1
+            index.delete(delete_all=True, namespace=namespace)
+    finally:
+        db.close()
+    print(f"Collection {collection_id}: {len(namespaces)} legacy namespaces, {reindexed} documents re-indexed")
+    return reindexed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collections", type=int, nargs="*", help="Collection ids to migrate (default: all)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Vectors fetched and upserted per request")
+    parser.add_argument("--dry-run", action="store_true", help="Count vectors without writing anything")
+    parser.add_argument("--delete-source", action="store_true", help="Delete each per-collection index after copying it")
+    parser.add_argument("--reindex-legacy", action="store_true", help="Re-index documents left in document-{id} namespaces instead of migrating")
+    args = parser.parse_args()
+    if args.reindex_legacy and VECTOR_STORE != "pinecone":
+        parser.error("--reindex-legacy re-indexes into the per-collection layout; run it with VECTOR_STORE=pinecone")
+
+    db = SessionLocal()
+    try:
+        query = db.query(Collection.id)
+        if args.collections:
+            query = query.filter(Collection.id.in_(args.collections))
+        collection_ids = [collection_id for collection_id, in query.order_by(Collection.id).all()]
+    finally:
+        db.close()
+
+    source = PineconeVectorStore()
+    if args.reindex_legacy:
+        total = sum(reindex_legacy_collection(source, collection_id, args.dry_run) for collection_id in collection_ids)
+        print(f"Re-indexed {total} documents from {len(collection_ids)} collections")
+        return
+    target = None if args.dry_run else SharedPineconeVectorStore()
+    total = 0
+    for collection_id in collection_ids:
+        copied = migrate_collection(source, target, collection_id, args.batch_size, args.dry_run)
+        if copied is None:
+            continue
+        total += copied
+        if args.delete_source and not args.dry_run:
+            source.delete_collection(collection_id)
+    print(f"Migrated {total} vectors from {len(collection_ids)} collections")
+
+if __name__ == "__main__":
+    main()
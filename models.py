@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, JSON, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, JSON, DateTime, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -21,12 +21,16 @@ class Collection(Base):
     name = Column(String, index=True)
     description = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
+    version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped on every document change
     created_time = Column(DateTime(timezone=True), server_default=func.now())
     updated_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     user = relationship("User", back_populates="collections")
     documents = relationship("Document", back_populates="collection", cascade="all, delete-orphan")
 
+    # AUTOINCREMENT stops SQLite reusing a deleted collection's id, which keys its vectors.
+    __table_args__ = (Index("ix_collections_user_id_id", "user_id", "id"), {"sqlite_autoincrement": True})
+
 
 class Document(Base):
     __tablename__ = "documents"
@@ -34,11 +38,18 @@ class Document(Base):
     title = Column(String)
     content = Column(String)
     collection_id = Column(Integer, ForeignKey("collections.id"))
+    chunk_hashes = Column(JSON, nullable=True)  # Content hashes of the indexed paragraphs
+    index_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped with every stored manifest
+    job_id = Column(String, nullable=True, index=True)  # Bulk ingestion job that indexes it
+    status = Column(String, default="pending")  # pending, indexing, indexed or failed
+    indexed_at = Column(DateTime(timezone=True), nullable=True)
     created_time = Column(DateTime(timezone=True), server_default=func.now())
     updated_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     collection = relationship("Collection", back_populates="documents")
 
+    __table_args__ = (Index("ix_documents_collection_id_id", "collection_id", "id"),)
+
 class History(Base):
     __tablename__ = 'chat_histories'
     id = Column(Integer, primary_key=True, index=True)
@@ -48,4 +59,26 @@ class History(Base):
     bot_response = Column(Text, nullable=False)  # Save the bot's response
     created_at = Column(DateTime(timezone=True), server_default=func.now())  # Save timestamp
 
-    user = relationship("User", back_populates="chat_histories")
\ No newline at end of file
+    user = relationship("User", back_populates="chat_histories")
+    collection_links = relationship("HistoryCollection", cascade="all, delete-orphan")
+
+    __table_args__ = (Index("ix_chat_histories_user_id_created_at", "user_id", "created_at"),)
+
+class HistoryCollection(Base):
+    __tablename__ = 'chat_history_collections'
+    history_id = Column(Integer, ForeignKey('chat_histories.id'), primary_key=True)
+    collection_id = Column(Integer, primary_key=True, index=True)  # Lets history be filtered by collection
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    id = Column(String, primary_key=True, index=True)
+    collection_id = Column(Integer, ForeignKey("collections.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String, default="queued")  # queued, running, completed or failed
+    total_documents = Column(Integer, default=0)
+    indexed_documents = Column(Integer, default=0)
+    failed_documents = Column(Integer, default=0)
+    indexed_chunks = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_time = Column(DateTime(timezone=True), server_default=func.now())
+    updated_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
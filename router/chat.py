@@ -1,63 +1,223 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 from auth import get_current_user
-from database import get_db
-from service.chatbot_service import generate_response
-from service.pinecone_service import search_documents
+from database import get_db, get_async_db, AsyncSessionLocal
+from service.chatbot_service import generate_response, stream_response, finalize_response, scheduler_stats, record_stream_generation
+from service.pinecone_service import search_documents, embed_query, lexical_candidates, lexical_confident
+from service.answer_cache import answer_cache, collection_versions, normalize_query, ANSWER_CACHE_ENABLED
 from dotenv import load_dotenv
-from models import User, History, Collection
+from models import User, History, HistoryCollection, Collection
 from datetime import datetime
+from time import perf_counter
+import anyio
+import base64
+import json
+import logging
 import os
 
 load_dotenv()
 
+HISTORY_SUMMARY_CHARS = int(os.getenv("HISTORY_SUMMARY_CHARS", "200"))
+
+logger = logging.getLogger(__name__)
+
 class ChatRequest(BaseModel):
     query: str
     collection_ids: list[int]
 
 router = APIRouter(prefix="/chat")
 
+async def resolve_collection_ids(db: AsyncSession, current_user: User, collection_ids: list):
+    if 0 in collection_ids:
+        result = await db.execute(select(Collection.id).filter(Collection.user_id == current_user.id))
+        collection_ids = list(result.scalars())
+        logger.debug("Resolved all collections", extra={"user_id": current_user.id, "collection_ids": collection_ids})
+    return collection_ids
+
+def source_paragraphs(documents: list):
+    return [{"collection_id": doc["collection_id"], "document_id": doc["document_id"], "paragraph": doc["match"]["metadata"]["text"]} for doc in documents]
+
+async def save_history(db: AsyncSession, user_id: int, query: str, collection_ids: list, response: str):
+    chat_history = History(
+        user_id = user_id,
+        query = query,
+        collection_ids = collection_ids,
+        bot_response = response,
+        collection_links = [HistoryCollection(collection_id=collection_id) for collection_id in set(collection_ids)]
+    )
+    db.add(chat_history)
+    await db.commit()
+
+async def lookup_answer(db: AsyncSession, query: str, collection_ids: list):
+    """Embed the normalized query and check the answer cache; returns ``(lexical, embedding, versions, cached)``.
+
+    In hybrid mode the BM25 search runs first. A confident lexical result is answered
+    from it alone, so the query is never embedded and the answer is not cached.
+    """
+    lexical = await lexical_candidates(collection_ids, query)
+    if not ANSWER_CACHE_ENABLED or lexical_confident(lexical):
+        # Retrieval embeds the query itself, and only if the lexical fast path doesn't answer it.
+        return lexical, None, {}, None
+    query_embedding = await embed_query(normalize_query(query))
+    versions = await collection_versions(db, collection_ids)
+    cached = answer_cache.lookup(query_embedding, versions)
+    return lexical, query_embedding, versions, cached
+
+def sse_event(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/query")
-async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def chat_with_bot(request: ChatRequest, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     query = request.query
-    collection_ids = request.collection_ids
-    if 0 in collection_ids:
-        collections = db.query(Collection).filter(Collection.user_id == current_user.id).all()
-        collection_ids = []
-        for collection in collections:
-            collection_ids.append(collection.id)
-        print(collection_ids)
-    documents = await search_documents(CollectionList = collection_ids, query=query)
+    collection_ids = await resolve_collection_ids(db, current_user, request.collection_ids)
+    lexical, query_embedding, versions, cached = await lookup_answer(db, query, collection_ids)
+    if cached is not None:
+        response, candidate_paragraphs = cached
+        await save_history(db, current_user.id, query, collection_ids, response)
+        return {"user": query, "answer": response, "source_data": candidate_paragraphs, "cached": True}
+
+    documents = await search_documents(CollectionList = collection_ids, query=query, query_embedding=query_embedding, lexical=lexical)
     response = ""
     candidate_paragraphs = []
     if len(documents) == 0:
         response = os.getenv("DEFAULT_ANSWER")
     else:
-        for doc in documents:
-            candidate_paragraphs.append({"collection_id": doc["collection_id"], "document_id": doc["document_id"], "paragraph": doc["match"]["metadata"]["text"]})
+        candidate_paragraphs = source_paragraphs(documents)
         response = await generate_response(query, documents)
 
-    chat_history = History(
-        user_id = current_user.id,
-        query = query,
-        collection_ids = collection_ids,
-        bot_response = response
-    )
-    db.add(chat_history)
-    db.commit()
-    return {"user": query, "answer": response, "source_data": candidate_paragraphs}
+    if query_embedding is not None:
+        answer_cache.store(query_embedding, versions, response, candidate_paragraphs)
+    await save_history(db, current_user.id, query, collection_ids, response)
+    return {"user": query, "answer": response, "source_data": candidate_paragraphs, "cached": False}
+
+
+@router.post("/query/stream")
+async def stream_chat_with_bot(request: ChatRequest, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    """Server-Sent Events variant of ``/chat/query``.
+
+    Emits one ``sources`` event, then ``token`` events as text is generated, then
+    a ``done`` event with the final answer. The answer generated so far is saved
+    to the history even if the client disconnects mid-stream.
+    """
+    query = request.query
+    user_id = current_user.id
+    collection_ids = await resolve_collection_ids(db, current_user, request.collection_ids)
+    lexical, query_embedding, versions, cached = await lookup_answer(db, query, collection_ids)
+    documents = []
+    if cached is None:
+        documents = await search_documents(CollectionList = collection_ids, query=query, query_embedding=query_embedding, lexical=lexical)
+
+    async def event_stream():
+        response = ""
+        stop_event = None
+        try:
+            if cached is not None:
+                response, candidate_paragraphs = cached
+                yield sse_event("sources", {"source_data": candidate_paragraphs})
+                yield sse_event("token", {"text": response})
+                yield sse_event("done", {"user": query, "answer": response, "cached": True})
+                return
+            candidate_paragraphs = source_paragraphs(documents)
+            yield sse_event("sources", {"source_data": candidate_paragraphs})
+            if len(documents) == 0:
+                response = os.getenv("DEFAULT_ANSWER")
+                yield sse_event("token", {"text": response})
+            else:
+                streamer, context, stop_event, prompt_tokens = await stream_response(query, documents)
+                start = perf_counter()
+                first_token_time = None
+                async for text in iterate_in_threadpool(streamer):
+                    if first_token_time is None:
+                        first_token_time = perf_counter()
+                    response += text
+                    yield sse_event("token", {"text": text})
+                end = perf_counter()
+                first_token_time = first_token_time or end
+                record_stream_generation(prompt_tokens, response, first_token_time - start, end - first_token_time)
+                response = finalize_response(response, context)
+            if query_embedding is not None:
+                answer_cache.store(query_embedding, versions, response, candidate_paragraphs)
+            yield sse_event("done", {"user": query, "answer": response, "cached": False})
+        finally:
+            if stop_event is not None:
+                stop_event.set()
+            # Shielded so the history is still written when the stream is cancelled by a disconnect.
+            with anyio.CancelScope(shield=True):
+                async with AsyncSessionLocal() as history_db:
+                    await save_history(history_db, user_id, query, collection_ids, response)
 
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/scheduler/stats")
+def inference_scheduler_stats(current_user: User = Depends(get_current_user)):
+    return scheduler_stats()
+
+
+def encode_history_cursor(record):
+    return base64.urlsafe_b64encode(json.dumps(record.id).encode()).decode()
+
+def decode_history_cursor(cursor: str):
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # Cursors issued before the page boundary was looked up were ``[created_at, id]``.
+        return int(value[-1] if isinstance(value, list) else value)
+    except (ValueError, TypeError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/history")
-def chat_with_bot(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    history = db.query(History).filter(History.user_id == current_user.id).all()
-    return [
-        {
+def get_chat_history(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    collection_id: int = None,
+    view: str = Query("full", regex="^(full|summary)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Newest-first chat history, one page at a time.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to get the next page.
+    ``view=summary`` truncates each answer to ``HISTORY_SUMMARY_CHARS`` characters.
+    """
+    if view == "summary":
+        bot_response = func.substr(History.bot_response, 1, HISTORY_SUMMARY_CHARS + 1).label("bot_response")
+    else:
+        bot_response = History.bot_response
+    history = db.query(History.id, History.query, History.collection_ids, bot_response, History.created_at).filter(History.user_id == current_user.id)
+    if start is not None:
+        history = history.filter(History.created_at >= start)
+    if end is not None:
+        history = history.filter(History.created_at < end)
+    if collection_id is not None:
+        history = history.filter(History.id.in_(db.query(HistoryCollection.history_id).filter(HistoryCollection.collection_id == collection_id)))
+    if cursor is not None:
+        # Rows after the cursor's row in (created_at, id) order. Its created_at is read back from the
+        # table rather than from the cursor, so both sides compare in the stored format.
+        cursor_id = decode_history_cursor(cursor)
+        cursor_created_at = select(History.created_at).where(History.id == cursor_id, History.user_id == current_user.id).scalar_subquery()
+        history = history.filter(or_(History.created_at < cursor_created_at, and_(History.created_at == cursor_created_at, History.id < cursor_id)))
+    records = history.order_by(History.created_at.desc(), History.id.desc()).limit(limit + 1).all()
+
+    items = []
+    for record in records[:limit]:
+        item = {
+            "id": record.id,
             "query": record.query,
             "collections": [collection_id for collection_id in record.collection_ids],
             "bot_response": record.bot_response,
             "created_at": record.created_at
         }
-        for record in history
-    ]
\ No newline at end of file
+        if view == "summary":
+            item["truncated"] = len(record.bot_response) > HISTORY_SUMMARY_CHARS
+            item["bot_response"] = record.bot_response[:HISTORY_SUMMARY_CHARS]
+        items.append(item)
+    next_cursor = encode_history_cursor(records[limit - 1]) if len(records) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
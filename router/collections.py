@@ -1,12 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from models import Collection, User, Document
+from pydantic import ValidationError
+from models import Collection, User, Document, IngestionJob
 from database import get_db
 from auth import get_current_user
 from pydantic import BaseModel
 from datetime import datetime
 from service.pinecone_service import create_index, delete_index, index_document, update_document, delete_document
+from service.ingestion_service import submit_ingestion_job, store_manifest, reindex_document
+from service.answer_cache import answer_cache, bump_collection_version
+import base64
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_FIELDS = ["id", "title", "content", "collection_id", "chunk_hashes", "status", "indexed_at", "created_time", "updated_time"]
+# Listings leave out the content (and the chunk manifest) unless asked for with ``fields``.
+DOCUMENT_LIST_FIELDS = ["id", "title", "collection_id", "status", "indexed_at", "created_time", "updated_time"]
+EXPORT_BATCH_SIZE = 500
 
 class CreateCollectionRequest(BaseModel):
     name: str
@@ -26,6 +43,9 @@ class UpdateDocumentRequest(BaseModel):
     title: str
     content: str
 
+class BulkCreateDocumentsRequest(BaseModel):
+    documents: list[CreateDocumentRequest]
+
 router = APIRouter(prefix="/collections")
 
 @router.post("/create")
@@ -63,19 +83,50 @@ def updating_document(request: UpdateCollectionRequest, db: Session = Depends(ge
     db.refresh(collection)
     return collection
 
+def encode_cursor(record_id: int):
+    return base64.urlsafe_b64encode(json.dumps(record_id).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def document_columns(fields: str, default: list):
+    """Document columns to select for a comma separated ``fields`` parameter; ``id`` is always included."""
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else default
+    unknown = [name for name in names if name not in DOCUMENT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown document fields: {', '.join(unknown)}")
+    names = ["id"] + [name for name in dict.fromkeys(names) if name != "id"]
+    return [getattr(Document, name) for name in names]
+
+def page(query, id_column, limit: int, cursor: str):
+    """Newest-first keyset page: ``limit`` rows with ids below the cursor, and the cursor of the next page."""
+    if cursor is not None:
+        query = query.filter(id_column < decode_cursor(cursor))
+    records = query.order_by(id_column.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(records[limit - 1].id) if len(records) > limit else None
+    return records[:limit], next_cursor
+
 @router.get("/getall")
-def get_collections(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_collections(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Newest-first collections, one page at a time; pass ``next_cursor`` back as ``cursor``."""
     try:
-        collections = db.query(Collection).filter(Collection.user_id == current_user.id).all()
-        collections.reverse()
-        return collections
+        collections, next_cursor = page(db.query(Collection).filter(Collection.user_id == current_user.id), Collection.id, limit, cursor)
+        return {"items": collections, "next_cursor": next_cursor}
     except SQLAlchemyError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Database error occurred: {str(e)}"
         )
     except Exception as e:
-        print("#################")
+        logger.exception("Failed to list collections")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An unexpected error occurred: {str(e)}"
@@ -86,9 +137,11 @@ def delete_collection(collection_id: int, db: Session = Depends(get_db), current
     collection = db.query(Collection).filter(Collection.id == collection_id, Collection.user_id == current_user.id).first()
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
+    # Vectors go first: the shared index finds the collection's namespace through its row.
+    delete_index(collection_id)
     db.delete(collection)
     db.commit()
-    delete_index(collection_id)
+    answer_cache.forget_collection(collection_id)
     return {"message": "Collection deleted"}
 
 @router.post("/{collection_id}/documents/create")
@@ -103,7 +156,14 @@ def create_document(request: CreateDocumentRequest, collection_id: int, db: Sess
     db.add(document)
     db.commit()
     db.refresh(document)
-    index_document(document)
+    if store_manifest(db, document.id, document.index_version, index_document(document)):
+        db.commit()
+    else:
+        db.rollback()
+        reindex_document(db, document.id)
+    bump_collection_version(db, collection_id)
+    db.commit()
+    db.refresh(document)
     return document
 
 @router.post("/{collection_id}/documents/update")
@@ -114,26 +174,148 @@ def updating_document(collection_id: int, request: UpdateDocumentRequest, db: Se
     document = db.query(Document).filter(Document.id == request.document_id, Document.collection_id == collection_id).first()
     if not document:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    version = document.index_version
+    previous_hashes, previous_content, previous_title = document.chunk_hashes, document.content, document.title
     document.title = request.title
     document.content = request.content
     db.commit()
     db.refresh(document)
-    update_document(document)
+    manifest = update_document(document, previous_hashes, previous_content, previous_title)
+    if store_manifest(db, document.id, version, manifest):
+        db.commit()
+    else:
+        # Another update or ingestion stored a manifest meanwhile, so this diff may have left vectors behind.
+        db.rollback()
+        reindex_document(db, document.id)
+    bump_collection_version(db, collection_id)
+    db.commit()
+    db.refresh(document)
     return document
 
+async def parse_bulk_documents(request: Request):
+    """Read documents from a JSON ``{"documents": [...]}`` body or an NDJSON stream of documents."""
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            documents = []
+            buffer = b""
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                documents.extend(CreateDocumentRequest.parse_obj(json.loads(line)) for line in lines if line.strip())
+            if buffer.strip():
+                documents.append(CreateDocumentRequest.parse_obj(json.loads(buffer)))
+            return documents
+        return BulkCreateDocumentsRequest.parse_obj(await request.json()).documents
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid documents payload: {str(e)}")
+
+def create_ingestion_job(db: Session, collection_id: int, user_id: int, documents: list):
+    job = IngestionJob(id=uuid.uuid4().hex, collection_id=collection_id, user_id=user_id, status="queued", total_documents=len(documents))
+    rows = [Document(title=document.title, content=document.content, collection_id=collection_id, status="pending", job_id=job.id) for document in documents]
+    db.add(job)
+    db.add_all(rows)
+    db.flush()
+    job_id, document_ids = job.id, [row.id for row in rows]
+    db.commit()
+    return job_id, document_ids
+
+@router.post("/{collection_id}/documents/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_create_documents(collection_id: int, request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Store many documents at once and index them in the background.
+
+    Accepts ``{"documents": [{"title", "content"}, ...]}`` or an ``application/x-ndjson``
+    body with one document per line. Returns the id of the ingestion job to poll.
+    """
+    collection = await run_in_threadpool(lambda: db.query(Collection).filter(Collection.id == collection_id, Collection.user_id == current_user.id).first())
+    if not collection:
+        raise HTTPException(status_code=403, detail="Unauthorized access to collection")
+    documents = await parse_bulk_documents(request)
+    if len(documents) == 0:
+        raise HTTPException(status_code=422, detail="No documents to ingest.")
+    try:
+        job_id, document_ids = await run_in_threadpool(create_ingestion_job, db, collection_id, current_user.id, documents)
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error occurred: {str(e)}"
+        )
+    submit_ingestion_job(job_id)
+    return {"job_id": job_id, "status": "queued", "total_documents": len(document_ids)}
+
+@router.get("/jobs/{job_id}")
+def get_ingestion_job(job_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    job = db.query(IngestionJob).filter(IngestionJob.id == job_id, IngestionJob.user_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    done = job.indexed_documents + job.failed_documents
+    return {
+        "job_id": job.id,
+        "collection_id": job.collection_id,
+        "status": job.status,
+        "total_documents": job.total_documents,
+        "indexed_documents": job.indexed_documents,
+        "failed_documents": job.failed_documents,
+        "indexed_chunks": job.indexed_chunks,
+        "progress": done / job.total_documents if job.total_documents else 1.0,
+        "error": job.error,
+        "created_time": job.created_time,
+        "updated_time": job.updated_time
+    }
+
+@router.get("/{collection_id}/documents/status")
+def get_documents_status(collection_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    collection = db.query(Collection).filter(Collection.id == collection_id, Collection.user_id == current_user.id).first()
+    if not collection:
+        raise HTTPException(status_code=403, detail="Unauthorized access to collection")
+    documents = db.query(Document.id, Document.title, Document.status, Document.indexed_at).filter(Document.collection_id == collection_id).all()
+    return [{"id": document.id, "title": document.title, "status": document.status, "indexed_at": document.indexed_at} for document in documents]
+
 @router.get("/{collection_id}/documents/get")
-def gettinging_document(collection_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def gettinging_document(
+    collection_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    fields: str = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Newest-first documents of a collection, one page at a time.
+
+    Only ``DOCUMENT_LIST_FIELDS`` are returned unless ``fields`` lists the wanted
+    columns, e.g. ``fields=id,title,content``. Pass ``next_cursor`` back as ``cursor``.
+    """
+    collection = db.query(Collection).filter(Collection.id == collection_id, Collection.user_id == current_user.id).first()
+    if not collection:
+        raise HTTPException(status_code=403, detail="Unauthorized access to collection")
+    columns = document_columns(fields, DOCUMENT_LIST_FIELDS)
+    documents, next_cursor = page(db.query(*columns).filter(Document.collection_id == collection_id), Document.id, limit, cursor)
+    return {"items": [dict(document._mapping) for document in documents], "next_cursor": next_cursor}
+
+@router.get("/{collection_id}/documents/export")
+def export_documents(collection_id: int, fields: str = None, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Stream every document of a collection as NDJSON, one document per line, oldest first.
+
+    Rows are fetched ``EXPORT_BATCH_SIZE`` at a time as the response is written,
+    so memory use doesn't grow with the collection. All fields are exported
+    unless ``fields`` narrows them.
+    """
     collection = db.query(Collection).filter(Collection.id == collection_id, Collection.user_id == current_user.id).first()
     if not collection:
         raise HTTPException(status_code=403, detail="Unauthorized access to collection")
-    documents = db.query(Document).filter(Document.collection_id == collection_id).all()
-    documents.reverse()
-    return documents
+    columns = document_columns(fields, DOCUMENT_FIELDS)
+    documents = db.query(*columns).filter(Document.collection_id == collection_id).order_by(Document.id).yield_per(EXPORT_BATCH_SIZE)
+
+    def rows():
+        for document in documents:
+            yield json.dumps(jsonable_encoder(dict(document._mapping))) + "\n"
+
+    headers = {"Content-Disposition": f'attachment; filename="collection-{collection_id}.ndjson"'}
+    return StreamingResponse(rows(), media_type="application/x-ndjson", headers=headers)
 
 @router.get("/{collection_id}/documents/get/{document_id}")
 def gettinging_document(collection_id: int, document_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     collection = db.query(Collection).filter(Collection.id == collection_id, Collection.user_id == current_user.id).first()
-    print(collection)
     if not collection:
         raise HTTPException(status_code=403, detail="Unauthorized access to collection")
     document = db.query(Document).filter(Document.id == document_id).first()
@@ -149,7 +331,9 @@ def deleting_document(collection_id: int, document_id: int, db: Session = Depend
     document = db.query(Document).filter(Document.id == document_id, Document.collection_id == collection_id).first()
     if not document:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    # Vectors go before the version bump, so no answer can be cached under the new version from deleted chunks.
+    delete_document(document)
     db.delete(document)
+    bump_collection_version(db, collection_id)
     db.commit()
-    delete_document(document)
     return document
\ No newline at end of file
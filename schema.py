@@ -0,0 +1,71 @@
+"""Bring an existing database up to date with the models.
+
+``create_all`` only creates missing tables, so databases created by an
+earlier version lack the columns and indexes added since. ``upgrade_schema``
+creates the missing tables, adds the missing columns and indexes, and fills
+the history-to-collection links for chat history written before that table
+existed. It runs on startup and is safe to run again.
+
+Usage:
+    python schema.py
+"""
+from sqlalchemy import inspect, insert, select
+from database import Base, engine
+from models import History, HistoryCollection
+
+HISTORY_LINK_BATCH_SIZE = 1000
+
+def column_ddl(column, dialect):
+    quote = dialect.identifier_preparer.quote
+    ddl = f"{quote(column.name)} {column.type.compile(dialect=dialect)}"
+    default = column.server_default.arg if column.server_default is not None else None
+    # Only constant defaults can be added to existing rows; other columns are added nullable.
+    if isinstance(default, str):
+        ddl += f" DEFAULT '{default}'"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+def add_missing_columns(connection):
+    inspector = inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    added = []
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                connection.exec_driver_sql(f"ALTER TABLE {quote(table.name)} ADD COLUMN {column_ddl(column, connection.dialect)}")
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+def create_missing_indexes(connection):
+    inspector = inspect(connection)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+    return created
+
+def backfill_history_links(connection):
+    """Link existing chat history rows to their collections, so history can be filtered by collection."""
+    rows = connection.execute(select(History.id, History.collection_ids)).all()
+    links = [{"history_id": history_id, "collection_id": collection_id} for history_id, collection_ids in rows for collection_id in set(collection_ids or [])]
+    for start in range(0, len(links), HISTORY_LINK_BATCH_SIZE):
+        connection.execute(insert(HistoryCollection), links[start:start + HISTORY_LINK_BATCH_SIZE])
+    return len(links)
+
+def upgrade_schema(bind=engine):
+    inspector = inspect(bind)
+    backfill_links = inspector.has_table(History.__tablename__) and not inspector.has_table(HistoryCollection.__tablename__)
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as connection:
+        changes = {"columns": add_missing_columns(connection), "indexes": create_missing_indexes(connection)}
+        if backfill_links:
+            changes["history_links"] = backfill_history_links(connection)
+    return changes
+
+if __name__ == "__main__":
+    print(upgrade_schema())
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from models import Collection
+from sqlalchemy import select
+from threading import Lock
+import numpy as np
+import itertools
+import os
+import re
+import time
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+def bump_collection_version(db, collection_id: int):
+    """Invalidate cached answers for a collection; call before committing a document change."""
+    db.query(Collection).filter(Collection.id == collection_id).update({Collection.version: Collection.version + 1}, synchronize_session=False)
+
+async def collection_versions(db, collection_ids: list):
+    """``{collection_id: (version, owner, created_time)}``.
+
+    The owner and creation time tell a collection apart from a later one that
+    reuses its id, which SQLite tables created before AUTOINCREMENT can do.
+    """
+    if not collection_ids:
+        return {}
+    result = await db.execute(
+        select(Collection.id, Collection.version, Collection.user_id, Collection.created_time).filter(Collection.id.in_(collection_ids))
+    )
+    return {collection_id: (version, user_id, created_time) for collection_id, version, user_id, created_time in result.all()}
+
+def normalize_query(query: str):
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+class _Entry:
+    def __init__(self, scope, embedding, versions, answer, source_data):
+        self.scope = scope
+        self.embedding = embedding
+        self.versions = versions
+        self.answer = answer
+        self.source_data = source_data
+        self.created = time.monotonic()
+
+class AnswerCache:
+    """Semantic cache of chat answers.
+
+    Entries are scoped to the exact set of collection ids a question was asked
+    against. A lookup hits when a cached question's embedding has cosine
+    similarity >= ``threshold`` with the new one and every collection is still
+    the same one (``collection_versions``) at the version recorded with the
+    entry. Eviction is LRU with a TTL.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._scopes = {}
+        self._ids = itertools.count()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        scope_ids = self._scopes.get(entry.scope)
+        if scope_ids is not None:
+            scope_ids.discard(entry_id)
+            if not scope_ids:
+                del self._scopes[entry.scope]
+
+    def lookup(self, embedding, versions: dict):
+        """Return the cached ``(answer, source_data)`` for a similar question, or None."""
+        scope = tuple(sorted(versions))
+        embedding = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._scopes.get(scope, ())):
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl or entry.versions != versions:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(entry.embedding, embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            return entry.answer, entry.source_data
+
+    def store(self, embedding, versions: dict, answer: str, source_data: list):
+        scope = tuple(sorted(versions))
+        entry = _Entry(scope, self._normalize(embedding), dict(versions), answer, source_data)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._scopes.setdefault(scope, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def forget_collection(self, collection_id: int):
+        """Drop the entries of every scope that includes a deleted collection."""
+        with self._lock:
+            for scope in [scope for scope in self._scopes if collection_id in scope]:
+                for entry_id in list(self._scopes.get(scope, ())):
+                    self._remove(entry_id)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+answer_cache = AnswerCache()
@@ -1,35 +1,225 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria
+from service.inference_scheduler import InferenceScheduler
+from service.context_builder import build_context
+from service.metrics import record, record_generation, timed
+from dotenv import load_dotenv
+from threading import Event, Lock
+import asyncio
+import torch
+import os
 import re
 
-local_dir = "model/llama-2-7b-chat-hf/"
+load_dotenv()
 
-tokenizer = AutoTokenizer.from_pretrained("meta-llama/Llama-2-7b-chat-hf", cache_dir=local_dir)
-model = AutoModelForCausalLM.from_pretrained("meta-llama/Llama-2-7b-chat-hf", cache_dir=local_dir)
+LLM_MODEL = os.getenv("LLM_MODEL", "meta-llama/Llama-2-7b-chat-hf")
+local_dir = os.getenv("LLM_MODEL_DIR", "model/llama-2-7b-chat-hf/")
+LLM_PRECISION = os.getenv("LLM_PRECISION", "fp32")  # fp32, bf16 or int8
+LLM_PREFIX_CACHE = os.getenv("LLM_PREFIX_CACHE", "true").lower() == "true"
+LLM_GREEDY = os.getenv("LLM_GREEDY", "false").lower() == "true"
+# safetensors checkpoints are memory-mapped while loading instead of unpickled into fresh buffers.
+LLM_SAFETENSORS = os.getenv("LLM_SAFETENSORS", "true").lower() == "true"
+# Small model sharing the main model's tokenizer, e.g. TinyLlama/TinyLlama-1.1B-Chat-v1.0
+DRAFT_MODEL = os.getenv("DRAFT_MODEL", "")
 
-async def generate_response(query: str, documents: list):
-    context = ""
-    for doc in documents:
-        context += doc["match"]["metadata"]["text"] + "\n"
-    input_text = f"""
+GENERATION_MAX_NEW_TOKENS = int(os.getenv("GENERATION_MAX_NEW_TOKENS", "256"))
+LLM_MAX_BATCH_SIZE = int(os.getenv("LLM_MAX_BATCH_SIZE", "4"))
+LLM_MAX_WAIT_MS = float(os.getenv("LLM_MAX_WAIT_MS", "25"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "1"))
+
+_tokenizer = None
+_model = None
+_draft_model = None
+_scheduler = None
+_load_lock = Lock()
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        with _load_lock:
+            if _tokenizer is None:
+                tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL, cache_dir=local_dir)
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                tokenizer.padding_side = "left"
+                _tokenizer = tokenizer
+    return _tokenizer
+
+def load_model(model_name: str = LLM_MODEL, precision: str = LLM_PRECISION):
+    """Load a causal LM for CPU inference in the requested precision.
+
+    ``bf16`` keeps bfloat16 weights (half the memory of fp32); ``int8`` applies
+    dynamic int8 quantization to the Linear layers after loading.
+    """
+    options = {"cache_dir": local_dir, "use_safetensors": LLM_SAFETENSORS, "low_cpu_mem_usage": True}
+    if precision == "bf16":
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.bfloat16, **options)
+    elif precision in ("fp32", "int8"):
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32, **options)
+        if precision == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        raise ValueError(f"Unknown LLM_PRECISION: {precision}")
+    model.eval()
+    return model
+
+def get_model():
+    global _model
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                _model = load_model()
+    return _model
+
+def get_draft_model():
+    global _draft_model
+    if DRAFT_MODEL and _draft_model is None:
+        with _load_lock:
+            if _draft_model is None:
+                _draft_model = load_model(DRAFT_MODEL)
+    return _draft_model
+
+def generation_kwargs():
+    if LLM_GREEDY:
+        return {"do_sample": False, "temperature": None, "top_p": None}
+    return {}
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        tokenizer, model, draft_model = get_tokenizer(), get_model(), get_draft_model()
+        with _load_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler(
+                    model,
+                    tokenizer,
+                    max_batch_size=LLM_MAX_BATCH_SIZE,
+                    max_wait_ms=LLM_MAX_WAIT_MS,
+                    num_workers=LLM_WORKERS,
+                    prompt_prefix=PROMPT_PREFIX if LLM_PREFIX_CACHE else None,
+                    assistant_model=draft_model,
+                    generation_kwargs=generation_kwargs(),
+                )
+    return _scheduler
+
+async def get_scheduler_async():
+    """``get_scheduler`` for async code: a first-time model load runs on a worker thread, not the event loop."""
+    if _scheduler is None:
+        return await asyncio.get_running_loop().run_in_executor(None, get_scheduler)
+    return _scheduler
+
+def scheduler_stats():
+    """The scheduler's stats, or zeroed ones while the LLM isn't loaded; never triggers a load."""
+    if _scheduler is not None:
+        return _scheduler.stats()
+    speculative = bool(DRAFT_MODEL)
+    return {
+        "queue_depth": 0,
+        "in_flight": 0,
+        "requests": 0,
+        "batches": 0,
+        "avg_batch_size": 0,
+        "max_batch_size": 1 if speculative else LLM_MAX_BATCH_SIZE,
+        "max_wait_ms": LLM_MAX_WAIT_MS,
+        "batch_size_histogram": {},
+        "prefix_cache_hits": 0,
+        "speculative": {
+            "enabled": speculative,
+            "requests": 0,
+            "draft_tokens": 0,
+            "accepted_tokens": 0,
+            "acceptance_rate": None,
+            "recent_acceptance_rates": [],
+        },
+    }
+
+def is_loaded():
+    return _tokenizer is not None and _model is not None and (not DRAFT_MODEL or _draft_model is not None)
+
+def load():
+    """Load the tokenizer and weights without running them.
+
+    Used by the pre-fork server, which must not start torch's thread pools
+    before forking workers.
+    """
+    get_tokenizer()
+    get_model()
+    get_draft_model()
+
+def warmup():
+    """Load the model and run one short generation so the first request doesn't pay for it."""
+    tokenizer, model, draft_model = get_tokenizer(), get_model(), get_draft_model()
+    inputs = tokenizer("Hello", return_tensors="pt")
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=1, pad_token_id=tokenizer.pad_token_id)
+        if draft_model is not None:
+            draft_model.generate(**inputs, max_new_tokens=1, pad_token_id=tokenizer.pad_token_id)
+
+class StopOnEvent(StoppingCriteria):
+    def __init__(self, event: Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+# Fixed start of every prompt; its KV cache is computed once and reused by the scheduler.
+PROMPT_PREFIX = """
     Use the following pieces of information to answer the user's question.
     If you don't know the answer, just say that you don't know, don't try to make up an answer.
-    Context: {context}
+    Context:"""
+
+def build_prompt(query: str, documents: list):
+    with timed("context_build"):
+        _, context = build_context(query, documents, get_tokenizer())
+    input_text = PROMPT_PREFIX + f""" {context}
     Question: {query}
     
     Only return the helpful answer below and nothing else.
     Helpful answer:
     """
-    inputs = tokenizer(input_text, return_tensors="pt")
-    outputs = model.generate(**inputs, max_length = 1000)
-    response = tokenizer.decode(outputs[0], skip_special_tokens = True)
+    return input_text, context
 
+def finalize_response(response: str, context: str):
     pattern = r"Helpful answer:\s*(.*)"
     match = re.search(pattern, response)
 
     if match:
         response = match.group(1).strip()
+    else:
+        response = response.strip()
 
     if "not available" not in response and not any(keyword in response for keyword in context.split()):
         response = "The information is not available in the context."
     
-    return response
\ No newline at end of file
+    return response
+
+async def generate_response(query: str, documents: list):
+    scheduler = await get_scheduler_async()
+    # Packing tokenizes every passage and may run the cross-encoder reranker, so keep it off the event loop.
+    input_text, context = await asyncio.to_thread(build_prompt, query, documents)
+    stats = {}
+    response = await scheduler.generate(input_text, GENERATION_MAX_NEW_TOKENS, stats=stats)
+    if stats:
+        record("llm_queue", stats["queue_wait"])
+        record("llm_prefill", stats["prefill"])
+        record("llm_decode", stats["decode"])
+        record_generation(stats["prompt_tokens"], stats["generated_tokens"], stats["decode"])
+    return finalize_response(response, context)
+
+async def stream_response(query: str, documents: list):
+    """Queue a streaming generation and return ``(streamer, context, stop_event, prompt_tokens)``.
+
+    Iterating the streamer yields decoded text as tokens are produced; setting
+    ``stop_event`` ends generation early, e.g. when the client disconnects.
+    """
+    scheduler = await get_scheduler_async()
+    input_text, context = await asyncio.to_thread(build_prompt, query, documents)
+    prompt_tokens = len(get_tokenizer()(input_text)["input_ids"])
+    stop_event = Event()
+    streamer = await scheduler.stream(input_text, GENERATION_MAX_NEW_TOKENS, stopping_criteria=[StopOnEvent(stop_event)])
+    return streamer, context, stop_event, prompt_tokens
+
+def record_stream_generation(prompt_tokens: int, response: str, time_to_first_token: float, decode_seconds: float):
+    """Record metrics for a streamed answer, timed from the consumer side."""
+    record("llm_prefill", time_to_first_token)
+    record("llm_decode", decode_seconds)
+    record_generation(prompt_tokens, len(get_tokenizer()(response, add_special_tokens=False)["input_ids"]), decode_seconds)
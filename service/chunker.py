@@ -0,0 +1,75 @@
+from dotenv import load_dotenv
+import os
+import re
+
+load_dotenv()
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+SENTENCE_PATTERN = re.compile(r"[^\n.!?]+(?:[.!?]+[\"')\]]*|\n|$)")
+
+def split_sentences(text: str):
+    """Return ``(start, end)`` spans of the sentences and lines in ``text``, whitespace trimmed."""
+    spans = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        start, end = match.span()
+        segment = text[start:end]
+        stripped = segment.strip()
+        if not stripped:
+            continue
+        start += len(segment) - len(segment.lstrip())
+        spans.append((start, start + len(stripped)))
+    return spans
+
+def _split_long_span(text: str, span, tokenizer, max_tokens: int):
+    """Cut a span longer than ``max_tokens`` into token windows, using the tokenizer's offsets."""
+    start, end = span
+    offsets = tokenizer(text[start:end], add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    pieces = []
+    for i in range(0, len(offsets), max_tokens):
+        window = offsets[i:i + max_tokens]
+        pieces.append(((start + window[0][0], start + window[-1][1]), len(window)))
+    return pieces
+
+def chunk_text(text: str, tokenizer, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """Split ``text`` into chunks of at most ``max_tokens`` tokens.
+
+    Sentences and short lines are packed together up to the limit, chunks break
+    only on sentence or line boundaries (a single sentence longer than the limit
+    is cut by tokens), and each chunk repeats up to ``overlap_tokens`` tokens of
+    trailing sentences from the previous one. Returns dicts with ``text`` and the
+    ``start``/``end`` character offsets of the chunk in ``text``.
+    """
+    spans = split_sentences(text)
+    if not spans:
+        return []
+    counts = [len(ids) for ids in tokenizer([text[start:end] for start, end in spans], add_special_tokens=False)["input_ids"]]
+    segments = []
+    for span, count in zip(spans, counts):
+        if count > max_tokens:
+            segments.extend(_split_long_span(text, span, tokenizer, max_tokens))
+        else:
+            segments.append((span, count))
+
+    chunks = []
+    current, size = [], 0
+    for segment in segments:
+        if current and size + segment[1] > max_tokens:
+            chunks.append(current)
+            overlap, overlap_size = [], 0
+            for previous in reversed(current[1:]):
+                if overlap_size + previous[1] > overlap_tokens or overlap_size + previous[1] + segment[1] > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous[1]
+            current, size = overlap, overlap_size
+        current.append(segment)
+        size += segment[1]
+    chunks.append(current)
+
+    return [
+        {"text": text[chunk[0][0][0]:chunk[-1][0][1]], "start": chunk[0][0][0], "end": chunk[-1][0][1]}
+        for chunk in chunks
+    ]
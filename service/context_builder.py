@@ -0,0 +1,73 @@
+from dotenv import load_dotenv
+from threading import Lock
+import os
+import re
+
+load_dotenv()
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1024"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.9"))
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+
+_reranker = None
+_reranker_lock = Lock()
+
+def get_reranker():
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+
+                _reranker = CrossEncoder(RERANKER_MODEL)
+    return _reranker
+
+def _words(text: str):
+    return set(re.findall(r"\w+", text.lower()))
+
+def _is_duplicate(words: set, kept: list, threshold: float):
+    for other in kept:
+        union = words | other
+        if union and len(words & other) / len(union) >= threshold:
+            return True
+    return False
+
+def deduplicate(documents: list, threshold: float = CONTEXT_DEDUP_THRESHOLD):
+    """Drop paragraphs whose word sets overlap an earlier one by at least ``threshold`` (Jaccard)."""
+    kept, kept_words = [], []
+    for doc in documents:
+        words = _words(doc["match"]["metadata"]["text"])
+        if _is_duplicate(words, kept_words, threshold):
+            continue
+        kept.append(doc)
+        kept_words.append(words)
+    return kept
+
+def rerank(query: str, documents: list):
+    if not documents:
+        return documents
+    scores = get_reranker().predict([(query, doc["match"]["metadata"]["text"]) for doc in documents])
+    ranked = sorted(zip(scores, range(len(documents))), reverse=True)
+    return [documents[i] for _, i in ranked]
+
+def build_context(query: str, documents: list, tokenizer, token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """Pick the best retrieved paragraphs that fit in ``token_budget`` prompt tokens.
+
+    Paragraphs are ordered by retrieval score (or by the cross-encoder when
+    ``RERANKER_MODEL`` is set), near-duplicates are dropped, and passages are
+    packed greedily in that order. Returns ``(selected_documents, context)``.
+    """
+    ranked = sorted(documents, key=lambda doc: doc["match"]["score"], reverse=True)
+    ranked = deduplicate(ranked)
+    if RERANKER_MODEL:
+        ranked = rerank(query, ranked)
+    texts = [doc["match"]["metadata"]["text"] for doc in ranked]
+    lengths = [len(ids) + 1 for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]] if texts else []
+    selected, used = [], 0
+    for doc, length in zip(ranked, lengths):
+        if used + length > token_budget:
+            continue
+        selected.append(doc)
+        used += length
+    context = "".join(doc["match"]["metadata"]["text"] + "\n" for doc in selected)
+    return selected, context
@@ -0,0 +1,139 @@
+from collections import deque
+from concurrent.futures import Future
+from threading import Thread
+import asyncio
+import queue
+import time
+import numpy as np
+import torch
+
+
+class _Request:
+    def __init__(self, texts, single):
+        self.texts = texts
+        self.single = single
+        self.future = Future()
+        self.results = []
+        self.done = 0
+
+
+class EmbeddingService:
+    """Shares one embedding model between all callers through micro-batching.
+
+    ``encode`` calls from any thread (and ``aencode`` from the event loop) are
+    queued; a dedicated thread collects the requests that arrive within
+    ``max_wait_ms`` of each other, up to ``max_batch_size`` texts, and embeds
+    them in a single forward pass. Requests larger than ``max_batch_size``
+    (e.g. bulk ingestion) are embedded ``max_batch_size`` texts at a time, and
+    queued small requests (queries) run between those slices, so a query never
+    waits for more than one slice of a bulk request.
+    """
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=5, torch_threads=None, encode_batch_size=256):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.torch_threads = torch_threads
+        self.encode_batch_size = encode_batch_size
+        self._queue = queue.Queue()
+        self._bulk = deque()
+        self._thread = Thread(target=self._run, name="embedding", daemon=True)
+        self._thread.start()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    def submit(self, texts):
+        single = isinstance(texts, str)
+        request = _Request([texts] if single else list(texts), single)
+        if not request.texts:
+            request.future.set_result(np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32))
+        else:
+            self._queue.put(request)
+        return request.future
+
+    def encode(self, texts):
+        """Embed a string or a list of strings, blocking until the batch containing them is done."""
+        return self.submit(texts).result()
+
+    async def aencode(self, texts):
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() + len(self._bulk),
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_texts_per_batch": self.texts / self.batches if self.batches else 0,
+        }
+
+    def _collect(self):
+        """Micro-batch the waiting small requests; bulk requests are set aside in ``_bulk``.
+
+        Returns an empty batch when nothing small is waiting but a bulk request is.
+        """
+        batch = []
+        size = 0
+        deadline = None
+        while size < self.max_batch_size:
+            try:
+                if batch:
+                    request = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                elif self._bulk:
+                    request = self._queue.get_nowait()
+                else:
+                    request = self._queue.get()
+            except queue.Empty:
+                break
+            if len(request.texts) > self.max_batch_size:
+                self._bulk.append(request)
+                continue
+            if not batch:
+                deadline = time.monotonic() + self.max_wait
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _encode(self, texts):
+        with torch.no_grad():
+            embeddings = self.model.encode(texts, batch_size=self.encode_batch_size, convert_to_numpy=True)
+        self.batches += 1
+        self.texts += len(texts)
+        return embeddings
+
+    def _run_bulk_slice(self):
+        request = self._bulk[0]
+        texts = request.texts[request.done:request.done + self.max_batch_size]
+        try:
+            request.results.append(self._encode(texts))
+        except Exception as e:
+            self._bulk.popleft()
+            request.future.set_exception(e)
+            return
+        request.done += len(texts)
+        if request.done == len(request.texts):
+            self._bulk.popleft()
+            self.requests += 1
+            request.future.set_result(np.concatenate(request.results))
+
+    def _run(self):
+        if self.torch_threads:
+            torch.set_num_threads(self.torch_threads)
+        while True:
+            batch = self._collect()
+            if not batch:
+                self._run_bulk_slice()
+                continue
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = self._encode(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self.requests += len(batch)
+            offset = 0
+            for request in batch:
+                result = embeddings[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+                request.future.set_result(result[0] if request.single else result)
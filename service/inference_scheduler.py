@@ -0,0 +1,292 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+from transformers import DynamicCache, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from threading import Lock, local
+from time import perf_counter
+import asyncio
+import copy
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    def __init__(self, prompt, max_new_tokens, future=None, streamer=None, stopping_criteria=None, stats=None):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.future = future
+        self.streamer = streamer
+        self.stopping_criteria = stopping_criteria
+        self.stats = stats
+        self.enqueued = perf_counter()
+
+
+class _FirstTokenTimer(StoppingCriteria):
+    """Never stops generation; records when the first new token was produced (end of prefill)."""
+
+    def __init__(self):
+        self.first_token_time = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_time is None:
+            self.first_token_time = perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+class InferenceScheduler:
+    """Owns a causal LM and serves generation requests off the event loop.
+
+    Requests are submitted through an asyncio queue. A dispatcher collects the
+    requests that arrive within ``max_wait_ms`` of each other (up to
+    ``max_batch_size``), left-pads them into one ``generate`` call and runs it on
+    a dedicated worker thread. Streaming requests always run as a batch of one,
+    because a streamer can only follow a single sequence.
+
+    When ``prompt_prefix`` is given, prompts starting with it are tokenized as
+    prefix + rest, and single-sequence batches start from a copy of the prefix's
+    precomputed KV cache instead of prefilling it again. Padded batches can't
+    share it because left padding shifts the prefix positions.
+
+    With an ``assistant_model`` every request is decoded speculatively: the
+    draft model proposes tokens and the main model verifies them in one forward
+    pass. Assisted generation only supports one sequence at a time, so batching
+    and the prefix cache are turned off in that mode.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=4, max_wait_ms=25, num_workers=1, prompt_prefix=None, assistant_model=None, generation_kwargs=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.assistant_model = assistant_model
+        self.generation_kwargs = generation_kwargs or {}
+        if assistant_model is not None:
+            max_batch_size = 1
+            prompt_prefix = None
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.num_workers = num_workers
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="llm-inference")
+        self._queue = None
+        self._deferred = deque()
+        self._dispatchers = []
+        self.requests = 0
+        self.batches = 0
+        self.in_flight = 0
+        self.batch_sizes = Counter()
+        self.prompt_prefix = prompt_prefix
+        self.prefix_cache_hits = 0
+        self._prefix_ids = None
+        self._prefix_kv = None
+        self._prefix_lock = Lock()
+        self.speculative_requests = 0
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+        self.recent_acceptance_rates = deque(maxlen=100)
+        self._counters = local()
+        if assistant_model is not None:
+            model.register_forward_hook(self._count_forward("target_calls"))
+            assistant_model.register_forward_hook(self._count_forward("draft_calls"))
+
+    def _ensure_started(self):
+        if self._queue is None:
+            loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            self._dispatchers = [loop.create_task(self._dispatch()) for _ in range(self.num_workers)]
+
+    async def generate(self, prompt, max_new_tokens, stats=None):
+        """Generate a completion for ``prompt`` and return only the new text.
+
+        If ``stats`` is a dict it receives the queue wait, prefill and decode
+        seconds and the prompt and generated token counts of this request.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Job(prompt, max_new_tokens, future=future, stats=stats))
+        return await future
+
+    async def stream(self, prompt, max_new_tokens, stopping_criteria=None):
+        """Queue a streaming generation and return its ``TextIteratorStreamer``."""
+        self._ensure_started()
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        await self._queue.put(_Job(prompt, max_new_tokens, streamer=streamer, stopping_criteria=stopping_criteria))
+        return streamer
+
+    def stats(self):
+        return {
+            "queue_depth": (self._queue.qsize() if self._queue is not None else 0) + len(self._deferred),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "prefix_cache_hits": self.prefix_cache_hits,
+            "speculative": {
+                "enabled": self.assistant_model is not None,
+                "requests": self.speculative_requests,
+                "draft_tokens": self.draft_tokens,
+                "accepted_tokens": self.accepted_tokens,
+                "acceptance_rate": self.accepted_tokens / self.draft_tokens if self.draft_tokens else None,
+                "recent_acceptance_rates": list(self.recent_acceptance_rates),
+            },
+        }
+
+    async def _next_job(self, timeout=None):
+        if self._deferred:
+            return self._deferred.popleft()
+        if timeout is None:
+            return await self._queue.get()
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        first = await self._next_job()
+        batch = [first]
+        if first.streamer is not None:
+            return batch
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                job = await self._next_job(timeout)
+            except asyncio.TimeoutError:
+                break
+            if job.streamer is not None:
+                self._deferred.append(job)
+                break
+            batch.append(job)
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if batch[0].streamer is None:
+                batch = [job for job in batch if not job.future.done()]
+                if not batch:
+                    continue
+            self.requests += len(batch)
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+            self.in_flight += len(batch)
+            try:
+                if batch[0].streamer is not None:
+                    try:
+                        await loop.run_in_executor(self._executor, self._run_stream, batch[0])
+                    except Exception:
+                        logger.exception("Streaming generation failed")
+                    continue
+                try:
+                    responses = await loop.run_in_executor(self._executor, self._run_batch, batch)
+                except Exception as e:
+                    for job in batch:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                    continue
+                for job, response in zip(batch, responses):
+                    if not job.future.done():
+                        job.future.set_result(response)
+            finally:
+                self.in_flight -= len(batch)
+
+    def _encode(self, prompt):
+        """Return ``(input_ids, has_prefix)`` for a prompt."""
+        if self.prompt_prefix and prompt.startswith(self.prompt_prefix):
+            if self._prefix_ids is None:
+                self._prefix_ids = self.tokenizer(self.prompt_prefix)["input_ids"]
+            rest = self.tokenizer(prompt[len(self.prompt_prefix):], add_special_tokens=False)["input_ids"]
+            return self._prefix_ids + rest, len(rest) > 0
+        return self.tokenizer(prompt)["input_ids"], False
+
+    def _prefix_past(self):
+        if self._prefix_kv is None:
+            with self._prefix_lock:
+                if self._prefix_kv is None:
+                    with torch.no_grad():
+                        output = self.model(input_ids=torch.tensor([self._prefix_ids]), past_key_values=DynamicCache(), use_cache=True)
+                    self._prefix_kv = output.past_key_values
+        # generate() extends the cache in place, so every request gets its own copy.
+        return copy.deepcopy(self._prefix_kv)
+
+    def _inputs(self, batch):
+        encoded = [self._encode(job.prompt) for job in batch]
+        inputs = dict(self.tokenizer.pad({"input_ids": [input_ids for input_ids, _ in encoded]}, return_tensors="pt"))
+        if len(batch) == 1 and encoded[0][1]:
+            inputs["past_key_values"] = self._prefix_past()
+            self.prefix_cache_hits += 1
+        return inputs
+
+    def _count_forward(self, name):
+        def hook(module, args, output):
+            setattr(self._counters, name, getattr(self._counters, name, 0) + 1)
+        return hook
+
+    def _record_speculation(self, new_tokens):
+        # Each verification pass of the main model accepts some draft tokens plus one of its own.
+        target_calls = getattr(self._counters, "target_calls", 0)
+        draft_calls = getattr(self._counters, "draft_calls", 0)
+        accepted = max(new_tokens - target_calls, 0)
+        self.speculative_requests += 1
+        self.draft_tokens += draft_calls
+        self.accepted_tokens += accepted
+        acceptance_rate = accepted / draft_calls if draft_calls else 0.0
+        self.recent_acceptance_rates.append(acceptance_rate)
+        logger.info(
+            "Speculative decoding finished",
+            extra={"generated_tokens": new_tokens, "draft_tokens": draft_calls, "accepted_tokens": accepted, "acceptance_rate": acceptance_rate},
+        )
+
+    def _generate(self, inputs, **kwargs):
+        kwargs = {**self.generation_kwargs, **kwargs, "pad_token_id": self.tokenizer.pad_token_id}
+        with torch.no_grad():
+            if self.assistant_model is None:
+                return self.model.generate(**inputs, **kwargs)
+            self._counters.target_calls = 0
+            self._counters.draft_calls = 0
+            outputs = self.model.generate(**inputs, assistant_model=self.assistant_model, **kwargs)
+        self._record_speculation(outputs.shape[1] - inputs["input_ids"].shape[1])
+        return outputs
+
+    def _generated_length(self, tokens):
+        tokens = tokens.tolist()
+        eos = self.tokenizer.eos_token_id
+        return tokens.index(eos) + 1 if eos in tokens else len(tokens)
+
+    def _run_batch(self, batch):
+        start = perf_counter()
+        inputs = self._inputs(batch)
+        max_new_tokens = max(job.max_new_tokens for job in batch)
+        timer = _FirstTokenTimer()
+        outputs = self._generate(inputs, max_new_tokens=max_new_tokens, stopping_criteria=StoppingCriteriaList([timer]))
+        end = perf_counter()
+        first_token_time = timer.first_token_time or end
+        prompt_length = inputs["input_ids"].shape[1]
+        responses = []
+        for i, job in enumerate(batch):
+            generated = outputs[i, prompt_length:prompt_length + job.max_new_tokens]
+            if job.stats is not None:
+                job.stats.update({
+                    "queue_wait": start - job.enqueued,
+                    "prefill": first_token_time - start,
+                    "decode": end - first_token_time,
+                    "prompt_tokens": int(inputs["attention_mask"][i].sum()),
+                    "generated_tokens": self._generated_length(generated),
+                })
+            responses.append(self.tokenizer.decode(generated, skip_special_tokens=True))
+        return responses
+
+    def _run_stream(self, job):
+        inputs = self._inputs([job])
+        try:
+            self._generate(
+                inputs,
+                max_new_tokens=job.max_new_tokens,
+                streamer=job.streamer,
+                stopping_criteria=StoppingCriteriaList(job.stopping_criteria or []),
+            )
+        except Exception:
+            job.streamer.end()
+            raise
@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from threading import Lock, Thread
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import func
+from database import SessionLocal
+from models import Document, IngestionJob
+from service.pinecone_service import index_document, index_documents, delete_document
+from service.answer_cache import bump_collection_version
+from dotenv import load_dotenv
+import logging
+import os
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_DOCUMENTS_PER_BATCH = int(os.getenv("INGEST_DOCUMENTS_PER_BATCH", "64"))
+# A job whose runner hasn't recorded progress for this long is taken over; must exceed the time to index one batch.
+INGEST_JOB_TIMEOUT = int(os.getenv("INGEST_JOB_TIMEOUT", "900"))
+REINDEX_ATTEMPTS = 3
+
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_submitted = set()
+_submitted_lock = Lock()
+
+def store_manifest(db, document_id: int, version: int, manifest: list):
+    """Store a document's new chunk manifest, unless another writer stored one since ``version`` was read.
+
+    Returns False on a conflict: the caller's vectors were diffed against a stale
+    manifest and the document must be re-indexed with ``reindex_document``.
+    """
+    updated = db.query(Document).filter(Document.id == document_id, Document.index_version == version).update(
+        {"chunk_hashes": manifest, "index_version": version + 1, "status": "indexed", "indexed_at": func.now()},
+        synchronize_session=False,
+    )
+    return updated == 1
+
+def reindex_document(db, document_id: int):
+    """Replace all of a document's vectors with ones built from its current content.
+
+    Used after a lost ``store_manifest``: a full rebuild drops any vectors that the
+    concurrent writers' diffs left behind. Returns the stored manifest, or None if
+    the document is gone.
+    """
+    for _ in range(REINDEX_ATTEMPTS):
+        db.expire_all()
+        document = db.query(Document).filter(Document.id == document_id).first()
+        if document is None:
+            return None
+        version = document.index_version
+        delete_document(document)
+        manifest = index_document(document)
+        if store_manifest(db, document_id, version, manifest):
+            db.commit()
+            logger.info("Re-indexed document after a concurrent update", extra={"document_id": document_id})
+            return manifest
+        db.rollback()
+    raise RuntimeError(f"Document {document_id} kept changing while it was re-indexed")
+
+def submit_ingestion_job(job_id: str):
+    with _submitted_lock:
+        if job_id in _submitted:
+            return
+        _submitted.add(job_id)
+    ingest_executor.submit(run_ingestion_job, job_id)
+
+def _stale_jobs():
+    """Jobs nobody has touched for ``INGEST_JOB_TIMEOUT``: queued by, or running in, a process that stopped.
+
+    A runner touches its job after every batch, so ``updated_time`` is its heartbeat.
+    """
+    stale = datetime.now(timezone.utc) - timedelta(seconds=INGEST_JOB_TIMEOUT)
+    return and_(IngestionJob.status.in_(("queued", "running")), IngestionJob.updated_time < stale)
+
+def claim_job(db, job_id: str):
+    """Mark a job running if it is new or stale; False if another runner has it."""
+    claimed = db.query(IngestionJob).filter(
+        IngestionJob.id == job_id, or_(IngestionJob.status == "queued", _stale_jobs())
+    ).update({"status": "running", "updated_time": func.now()}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+def recover_ingestion_jobs():
+    """Resubmit the stale jobs left behind by a restart, a worker timeout or a deploy.
+
+    ``claim_job`` lets only one process run each job, so every worker may call this.
+    """
+    db = SessionLocal()
+    try:
+        job_ids = [job_id for job_id, in db.query(IngestionJob.id).filter(_stale_jobs()).all()]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        logger.info("Resubmitting a stale ingestion job", extra={"job_id": job_id})
+        submit_ingestion_job(job_id)
+    return job_ids
+
+def _recover_forever():
+    while True:
+        try:
+            recover_ingestion_jobs()
+        except Exception:
+            logger.exception("Recovering ingestion jobs failed")
+        time.sleep(INGEST_JOB_TIMEOUT)
+
+def start_job_recovery():
+    Thread(target=_recover_forever, name="ingest-recovery", daemon=True).start()
+
+def run_ingestion_job(job_id: str):
+    """Index the job's unfinished documents in batches and record progress on the job and each document.
+
+    Documents still ``pending`` or ``indexing`` are picked up, so a job resumed
+    after a restart continues where it stopped.
+    """
+    db = SessionLocal()
+    try:
+        if not claim_job(db, job_id):
+            return
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        while True:
+            documents = db.query(Document).filter(
+                Document.job_id == job_id, Document.status.in_(("pending", "indexing"))
+            ).order_by(Document.id).limit(INGEST_DOCUMENTS_PER_BATCH).all()
+            if not documents:
+                break
+            batch_ids = [document.id for document in documents]
+            versions = {document.id: document.index_version for document in documents}
+            for document in documents:
+                document.status = "indexing"
+            db.commit()
+            try:
+                manifests = index_documents(documents)
+            except Exception as e:
+                db.rollback()
+                for document in documents:
+                    document.status = "failed"
+                job.failed_documents += len(documents)
+                job.error = str(e)
+                db.commit()
+                logger.exception("Indexing a document batch failed", extra={"job_id": job_id, "document_ids": batch_ids})
+                continue
+            # A document updated while the batch ran has vectors of both versions; rebuild it from its current content.
+            conflicts = [document_id for document_id, manifest in manifests.items() if not store_manifest(db, document_id, versions[document_id], manifest)]
+            job.indexed_documents += len(documents)
+            job.indexed_chunks += sum(len(manifest) for manifest in manifests.values())
+            bump_collection_version(db, job.collection_id)
+            db.commit()
+            for document_id in conflicts:
+                reindex_document(db, document_id)
+        if job.indexed_documents + job.failed_documents < job.total_documents:
+            job.error = job.error or "Some documents of this job can no longer be found"
+        job.status = "failed" if job.error else "completed"
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        if job:
+            job.status = "failed"
+            job.error = str(e)
+            db.commit()
+        logger.exception("Ingestion job failed", extra={"job_id": job_id})
+    finally:
+        db.close()
+        with _submitted_lock:
+            _submitted.discard(job_id)
@@ -0,0 +1,175 @@
+from dotenv import load_dotenv
+from threading import local
+import os
+import re
+import sqlite3
+
+load_dotenv()
+
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.db")
+# BM25 weight of the chunk text and the document title.
+LEXICAL_TEXT_WEIGHT = float(os.getenv("LEXICAL_TEXT_WEIGHT", "1.0"))
+LEXICAL_TITLE_WEIGHT = float(os.getenv("LEXICAL_TITLE_WEIGHT", "0.5"))
+
+TERM_PATTERN = re.compile(r"\w+")
+
+# Chunks live in a plain table (indexed by document and collection, so deletes don't scan);
+# the FTS5 table is an external-content index over it, kept in sync by triggers.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    collection_id INTEGER NOT NULL,
+    document_id INTEGER NOT NULL,
+    title TEXT,
+    text TEXT NOT NULL,
+    start_offset INTEGER,
+    end_offset INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_chunks_document_id ON chunks (document_id);
+CREATE INDEX IF NOT EXISTS ix_chunks_collection_id ON chunks (collection_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text, title, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, text, title) VALUES (new.id, new.text, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, text, title) VALUES ('delete', old.id, old.text, old.title);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE OF text, title ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, text, title) VALUES ('delete', old.id, old.text, old.title);
+    INSERT INTO chunks_fts (rowid, text, title) VALUES (new.id, new.text, new.title);
+END;
+"""
+
+_connections = local()
+
+def _connection():
+    # sqlite3 connections can't be shared between threads; the search executor gets one per thread.
+    connection = getattr(_connections, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(LEXICAL_INDEX_PATH, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        _connections.connection = connection
+    return connection
+
+def match_expression(query: str):
+    """Turn free text into an FTS5 query: any of the words, with codes like ``XJ-9000`` kept as phrases."""
+    phrases = []
+    for term in query.split():
+        words = TERM_PATTERN.findall(term.lower())
+        if words:
+            phrase = '"' + " ".join(words) + '"'
+            if phrase not in phrases:
+                phrases.append(phrase)
+    return " OR ".join(phrases)
+
+def upsert_chunks(document, chunks):
+    """Add ``(key, chunk)`` pairs of a document; keys are the chunk hashes used for vector ids."""
+    if not LEXICAL_INDEX_ENABLED or not chunks:
+        return
+    connection = _connection()
+    with connection:
+        connection.executemany(
+            "DELETE FROM chunks WHERE chunk_id = ?",
+            [(f"{document.id}#{key}",) for key, _ in chunks],
+        )
+        connection.executemany(
+            "INSERT INTO chunks (text, title, chunk_id, collection_id, document_id, start_offset, end_offset) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(chunk["text"], document.title, f"{document.id}#{key}", document.collection_id, document.id, chunk["start"], chunk["end"]) for key, chunk in chunks],
+        )
+
+def update_offsets(document, chunks):
+    """Store the new offsets of ``(key, chunk)`` pairs whose text is unchanged but moved within the document."""
+    if not LEXICAL_INDEX_ENABLED or not chunks:
+        return
+    connection = _connection()
+    with connection:
+        connection.executemany(
+            "UPDATE chunks SET start_offset = ?, end_offset = ? WHERE chunk_id = ?",
+            [(chunk["start"], chunk["end"], f"{document.id}#{key}") for key, chunk in chunks],
+        )
+
+def update_title(document):
+    """Re-index the title of every chunk of a renamed document."""
+    if not LEXICAL_INDEX_ENABLED:
+        return
+    connection = _connection()
+    with connection:
+        connection.execute("UPDATE chunks SET title = ? WHERE document_id = ?", (document.title, document.id))
+
+def delete_chunks(ids):
+    if not LEXICAL_INDEX_ENABLED or not ids:
+        return
+    connection = _connection()
+    with connection:
+        connection.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+
+def delete_document(document_id):
+    if not LEXICAL_INDEX_ENABLED:
+        return
+    connection = _connection()
+    with connection:
+        connection.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+
+def delete_collection(collection_id):
+    if not LEXICAL_INDEX_ENABLED:
+        return
+    connection = _connection()
+    with connection:
+        connection.execute("DELETE FROM chunks WHERE collection_id = ?", (collection_id,))
+
+def search(collection_ids: list, query: str, top_k: int = 5):
+    """BM25 search over the chunks of the given collections, best first.
+
+    Results have the same shape as vector matches; ``score`` is the negated
+    FTS5 ``bm25()`` value, so higher is better.
+    """
+    expression = match_expression(query)
+    if not LEXICAL_INDEX_ENABLED or not expression or not collection_ids:
+        return []
+    placeholders = ", ".join("?" for _ in collection_ids)
+    rows = _connection().execute(
+        "SELECT c.chunk_id, c.collection_id, c.document_id, c.text, c.title, c.start_offset, c.end_offset, -bm25(chunks_fts, ?, ?) AS score "
+        "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid "
+        f"WHERE chunks_fts MATCH ? AND c.collection_id IN ({placeholders}) ORDER BY score DESC LIMIT ?",
+        (LEXICAL_TEXT_WEIGHT, LEXICAL_TITLE_WEIGHT, expression, *collection_ids, top_k),
+    ).fetchall()
+    return [
+        {
+            "collection_id": int(collection_id),
+            "document_id": int(document_id),
+            "match": {
+                "id": chunk_id,
+                "score": score,
+                "metadata": {"text": text, "document_id": int(document_id), "title": title, "start": start, "end": end},
+            },
+        }
+        for chunk_id, collection_id, document_id, text, title, start, end, score in rows
+    ]
+
+def rebuild():
+    """Re-create the index from the documents in the database, e.g. after enabling it on an existing deployment."""
+    from database import SessionLocal
+    from models import Document
+    from service.pinecone_service import _chunk_manifest
+
+    connection = _connection()
+    with connection:
+        connection.execute("DELETE FROM chunks")
+    db = SessionLocal()
+    try:
+        count = 0
+        for document in db.query(Document).yield_per(200):
+            upsert_chunks(document, list(_chunk_manifest(document).items()))
+            count += 1
+        return count
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print(f"Indexed {rebuild()} documents")
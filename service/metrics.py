@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from time import perf_counter
+import os
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_DURATION = Histogram("rag_request_duration_seconds", "HTTP request duration", ["method", "endpoint", "status"], buckets=STAGE_BUCKETS)
+STAGE_DURATION = Histogram("rag_stage_duration_seconds", "Duration of one pipeline stage", ["stage"], buckets=STAGE_BUCKETS)
+PROMPT_TOKENS = Counter("rag_prompt_tokens_total", "Prompt tokens sent to the LLM")
+GENERATED_TOKENS = Counter("rag_generated_tokens_total", "Tokens generated by the LLM")
+DECODE_TOKENS_PER_SECOND = Histogram("rag_decode_tokens_per_second", "LLM decode throughput per request", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+# Per-request stage totals; the timing middleware installs a fresh dict for every request.
+request_timings = ContextVar("request_timings", default=None)
+
+def record(stage: str, seconds: float):
+    STAGE_DURATION.labels(stage).observe(seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage: str):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, perf_counter() - start)
+
+def record_generation(prompt_tokens: int, generated_tokens: int, decode_seconds: float):
+    PROMPT_TOKENS.inc(prompt_tokens)
+    GENERATED_TOKENS.inc(generated_tokens)
+    tokens_per_second = generated_tokens / decode_seconds if decode_seconds > 0 else 0.0
+    if generated_tokens:
+        DECODE_TOKENS_PER_SECOND.observe(tokens_per_second)
+    timings = request_timings.get()
+    if timings is not None:
+        timings["prompt_tokens"] = timings.get("prompt_tokens", 0) + prompt_tokens
+        timings["generated_tokens"] = timings.get("generated_tokens", 0) + generated_tokens
+        timings["tokens_per_second"] = tokens_per_second
+
+def server_timing_header(timings: dict):
+    """Format stage durations (ms) and token counts for the ``Server-Timing`` header."""
+    entries = []
+    for name, value in timings.items():
+        if name.endswith("tokens") or name == "tokens_per_second":
+            entries.append(f'{name};desc="{value:g}"')
+        else:
+            entries.append(f"{name};dur={value * 1000:.1f}")
+    return ", ".join(entries)
+
+def metrics_payload():
+    # With several worker processes each one writes its samples to PROMETHEUS_MULTIPROC_DIR.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+class TimingMiddleware:
+    """Times every HTTP request and adds a ``Server-Timing`` header with its stage breakdown."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = {}
+        token = request_timings.set(timings)
+        start = perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                timings["total"] = perf_counter() - start
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # The router stores the matched endpoint in the shared scope; paths would explode label cardinality.
+            endpoint = scope.get("endpoint")
+            name = f"{endpoint.__module__}.{endpoint.__name__}" if endpoint is not None else "unmatched"
+            REQUEST_DURATION.labels(scope["method"], name, str(status["code"])).observe(perf_counter() - start)
+            request_timings.reset(token)
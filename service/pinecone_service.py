@@ -1,86 +1,276 @@
 from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
-import os
+from concurrent.futures import ThreadPoolExecutor
+from service.vector_store import get_vector_store
+from service.chunker import chunk_text
+from service.embedding_service import EmbeddingService
+from service.metrics import timed
+from service import lexical_index
 from dotenv import load_dotenv
-import re
+from threading import Lock
+import asyncio
+import hashlib
+import heapq
+import logging
+import os
+import torch
 
 load_dotenv()
 
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-model = SentenceTransformer('all-MiniLM-L6-v2')
+logger = logging.getLogger(__name__)
+
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", "5"))
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "8"))
+INGEST_ENCODE_BATCH = int(os.getenv("INGEST_ENCODE_BATCH", "256"))
+INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", "100"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+EMBED_QUANTIZE = os.getenv("EMBED_QUANTIZE", "").lower() == "int8"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")  # dense or hybrid
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "20"))
+# Hybrid mode answers from BM25 alone when the best hit scores at least this much and
+# LEXICAL_FAST_PATH_MARGIN times the runner-up; 0 always runs the vector search too.
+LEXICAL_FAST_PATH_SCORE = float(os.getenv("LEXICAL_FAST_PATH_SCORE", "8"))
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.5"))
+
+_model = None
+_embedding_service = None
+_model_lock = Lock()
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="vector-search")
+
+def get_embedding_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model = SentenceTransformer('all-MiniLM-L6-v2', device="cpu")
+                if EMBED_QUANTIZE:
+                    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                _model = model
+    return _model
+
+def get_embedding_service():
+    global _embedding_service
+    if _embedding_service is None:
+        model = get_embedding_model()
+        with _model_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService(
+                    model,
+                    max_batch_size=EMBED_MAX_BATCH_SIZE,
+                    max_wait_ms=EMBED_MAX_WAIT_MS,
+                    torch_threads=EMBED_TORCH_THREADS or None,
+                    encode_batch_size=INGEST_ENCODE_BATCH,
+                )
+    return _embedding_service
+
+async def get_embedding_service_async():
+    """``get_embedding_service`` for async code: a first-time model load runs on a worker thread."""
+    if _embedding_service is None:
+        return await asyncio.get_running_loop().run_in_executor(None, get_embedding_service)
+    return _embedding_service
+
+def is_loaded():
+    return _model is not None
+
+def load():
+    # Only the weights: the embedding service starts a thread, which would not survive a fork.
+    get_embedding_model()
+
+def warmup():
+    get_embedding_service().encode("warmup")
 
 def split_into_paragraph(text):
     return [p.strip() for p in text.split('\n') if p.strip()]
 
 def create_index(collection_id):
-    index_name = f"collection-{collection_id}"
     try:
-        pc.create_index(
-            name = index_name,
-            dimension=384,
-            metric="cosine",
-            spec = ServerlessSpec(
-                cloud = "aws",
-                region="us-east-1"
-            )
-        )
-        print(f"Created Pinecone index for collection: {collection_id}")
-    except Exception  as e:
-        print(f"An unexpected error occurred while creating the index for collection {collection_id}: {e}")
+        get_vector_store().create_collection(collection_id)
+        logger.info("Created vector index", extra={"collection_id": collection_id})
+    except Exception:
+        logger.exception("Creating the vector index failed", extra={"collection_id": collection_id})
 
 def delete_index(collection_id):
-    index_name = f"collection-{collection_id}"
+    lexical_index.delete_collection(collection_id)
     try:
-        pc.delete_index(index_name)
-        print(f"Collection {collection_id} successfully deleted")
-    except Exception as e:
-        print(f"An unexpected error occurred while deleting the index for collection {collection_id}: {e}")
+        get_vector_store().delete_collection(collection_id)
+        logger.info("Deleted vector index", extra={"collection_id": collection_id})
+    except Exception:
+        logger.exception("Deleting the vector index failed", extra={"collection_id": collection_id})
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def chunk_document(document):
+    return chunk_text(document.content, get_embedding_model().tokenizer)
+
+def _vector(document, key, chunk, embedding):
+    metadata = {"text": chunk["text"], "document_id": document.id, "title": document.title, "start": chunk["start"], "end": chunk["end"]}
+    return {"id": f"{document.id}#{key}", "values": embedding.tolist(), "metadata": metadata}
+
+def _upsert_chunks(document, chunks):
+    if not chunks:
+        return
+    embeddings = get_embedding_service().encode([chunk["text"] for _, chunk in chunks])
+    vectors = [_vector(document, key, chunk, embedding) for (key, chunk), embedding in zip(chunks, embeddings)]
+    get_vector_store().upsert(document.collection_id, vectors)
+    lexical_index.upsert_chunks(document, chunks)
+
+def _chunk_manifest(document):
+    """Unique chunks of the document keyed by their content hash, in document order."""
+    return {chunk_hash(chunk["text"]): chunk for chunk in chunk_document(document)}
+
+def _moved_chunks(kept, previous_content):
+    """The kept ``(key, chunk)`` pairs whose offsets differ from where they were in ``previous_content``.
+
+    Without the previous content every kept chunk counts as moved.
+    """
+    if previous_content is None:
+        return kept
+    previous = {chunk_hash(chunk["text"]): (chunk["start"], chunk["end"]) for chunk in chunk_text(previous_content, get_embedding_model().tokenizer)}
+    return [(key, chunk) for key, chunk in kept if previous.get(key) != (chunk["start"], chunk["end"])]
 
 def index_document(document):
-    paragraphs = split_into_paragraph(document.content)
-    embeddings = model.encode(paragraphs)
-    index_name = f"collection-{document.collection_id}"
-    index = pc.Index(index_name)
-    vectors = [{"id": f"paragraph-{i}", "values": embeddings[i].tolist(), "metadata": {"text": paragraphs[i]}} for i in range(len(paragraphs))]
-    # print(vectors)
-    index.upsert(
-        vectors=vectors,
-        namespace=f"document-{document.id}"
-    )
-
-def update_document(document):
-    index_name = f"collection-{document.collection_id}"
-    index = pc.Index(index_name)
-    index.delete(delete_all=True, namespace=f"document-{document.id}")
-    index_document(document)
-    print(f"Updated document {document.id} vectors in Pinecone.")
+    """Index every chunk of the document and return its chunk manifest (list of hashes)."""
+    manifest = _chunk_manifest(document)
+    _upsert_chunks(document, list(manifest.items()))
+    return list(manifest.keys())
+
+def index_documents(documents, upsert_batch_size=INGEST_UPSERT_BATCH):
+    """Index many documents at once and return their manifests keyed by document id.
+
+    Chunks of all documents are embedded together (in ``INGEST_ENCODE_BATCH`` forward passes) and
+    upserted in chunks of ``upsert_batch_size`` vectors per collection.
+    """
+    manifests = {}
+    document_chunks = []
+    chunks = []
+    for document in documents:
+        manifest = _chunk_manifest(document)
+        manifests[document.id] = list(manifest.keys())
+        document_chunks.append((document, list(manifest.items())))
+        chunks.extend((document, key, chunk) for key, chunk in manifest.items())
+    if not chunks:
+        return manifests
+    embeddings = get_embedding_service().encode([chunk["text"] for _, _, chunk in chunks])
+    by_collection = {}
+    for (document, key, chunk), embedding in zip(chunks, embeddings):
+        by_collection.setdefault(document.collection_id, []).append(_vector(document, key, chunk, embedding))
+    store = get_vector_store()
+    for collection_id, vectors in by_collection.items():
+        for start in range(0, len(vectors), upsert_batch_size):
+            store.upsert(collection_id, vectors[start:start + upsert_batch_size])
+    # Only once the vectors are in, so a failed batch leaves nothing searchable.
+    for document, items in document_chunks:
+        lexical_index.upsert_chunks(document, items)
+    return manifests
+
+def update_document(document, previous_hashes=None, previous_content=None, previous_title=None):
+    """Re-index only the chunks that changed since ``previous_hashes`` and return the new manifest.
+
+    Chunks whose text survived the edit keep their vectors; only the metadata
+    that changed (offsets if they moved, the title if it was renamed) is
+    rewritten. Documents indexed before manifests were stored have no previous
+    hashes and are re-indexed in full.
+    """
+    if previous_hashes is None:
+        get_vector_store().delete_document(document.collection_id, document.id)
+        lexical_index.delete_document(document.id)
+        manifest = index_document(document)
+        logger.info("Re-indexed document", extra={"document_id": document.id, "chunks": len(manifest)})
+        return manifest
+    manifest = _chunk_manifest(document)
+    previous = set(previous_hashes)
+    added = [(key, chunk) for key, chunk in manifest.items() if key not in previous]
+    kept = [(key, chunk) for key, chunk in manifest.items() if key in previous]
+    moved = _moved_chunks(kept, previous_content)
+    renamed = document.title != previous_title
+    removed = [f"{document.id}#{key}" for key in previous if key not in manifest]
+    _upsert_chunks(document, added)
+    changes = {f"{document.id}#{key}": {"start": chunk["start"], "end": chunk["end"]} for key, chunk in moved}
+    if renamed:
+        for key, _ in kept:
+            changes.setdefault(f"{document.id}#{key}", {})["title"] = document.title
+        lexical_index.update_title(document)
+    if changes:
+        get_vector_store().update_metadata(document.collection_id, document.id, changes)
+    lexical_index.update_offsets(document, moved)
+    if removed:
+        get_vector_store().delete_vectors(document.collection_id, document.id, removed)
+        lexical_index.delete_chunks(removed)
+    logger.info("Updated document vectors", extra={"document_id": document.id, "added": len(added), "moved": len(moved), "removed": len(removed)})
+    return list(manifest.keys())
 
 def delete_document(document):
-    index_name = f"collection-{document.collection_id}"
-    index = pc.Index(index_name)
-    index.delete(delete_all=True, namespace=f"document-{document.id}")
-    print(f"Document {document.id} vectors in Pinecone is deleted.")
-
-async def search_documents(CollectionList: list, query: str, threshold: float = 0.25 ):
-    query_embedding = model.encode(query).tolist()
-    # print(query_embedding)
-    results = []
-    assos_paragraph = []
-    for collection_id in CollectionList:
-        index_name = f"collection-{collection_id}"
-        print(collection_id)
-        index = pc.Index(index_name)
-        namespaces = list(index.describe_index_stats().get("namespaces", {}).keys())
-        for namespace in namespaces:
-            print(namespace)
-            mid_res = index.query(
-                namespace=namespace,
-                vector=query_embedding,
-                top_k=5,
-                include_metadata=True,
-            )
-            print(mid_res)
-            document_id = int(re.findall(r'\d+', namespace)[0])
-            results.extend([{"collection_id": collection_id, "document_id": document_id, "match": match} for match in mid_res["matches"] if match["score"] >= threshold])
-    # print(results)
-    return results
\ No newline at end of file
+    get_vector_store().delete_document(document.collection_id, document.id)
+    lexical_index.delete_document(document.id)
+    logger.info("Deleted document vectors", extra={"document_id": document.id})
+
+def _search_collection(collection_id, query_embedding, top_k, threshold):
+    matches = get_vector_store().query(collection_id, query_embedding, top_k=top_k)
+    return [{"collection_id": collection_id, **match} for match in matches if match["match"]["score"] >= threshold]
+
+def _search_collections(collection_ids, query_embedding, top_k, threshold):
+    matches = get_vector_store().query_collections(collection_ids, query_embedding, top_k=top_k)
+    return [match for match in matches if match["match"]["score"] >= threshold]
+
+async def embed_query(query: str):
+    with timed("embed"):
+        service = await get_embedding_service_async()
+        return (await service.aencode(query)).tolist()
+
+def lexical_confident(results):
+    if not LEXICAL_FAST_PATH_SCORE or not results or results[0]["match"]["score"] < LEXICAL_FAST_PATH_SCORE:
+        return False
+    return len(results) == 1 or results[0]["match"]["score"] >= LEXICAL_FAST_PATH_MARGIN * results[1]["match"]["score"]
+
+def reciprocal_rank_fusion(rankings: list, top_k: int, k: int = RRF_K):
+    """Merge ranked result lists; a chunk scores ``sum(1 / (k + rank))`` over the lists it appears in."""
+    scores, results = {}, {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            key = (result["collection_id"], result["match"]["id"])
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank)
+            results.setdefault(key, result)
+    best = heapq.nlargest(top_k, scores, key=scores.get)
+    return [{**results[key], "match": {**results[key]["match"], "score": scores[key]}} for key in best]
+
+async def lexical_candidates(CollectionList: list, query: str):
+    """The BM25 ranking that ``hybrid`` mode fuses with the vector one; ``None`` in ``dense`` mode."""
+    if RETRIEVAL_MODE != "hybrid" or not CollectionList:
+        return None
+    with timed("lexical_search"):
+        return await asyncio.get_running_loop().run_in_executor(search_executor, lexical_index.search, CollectionList, query, LEXICAL_TOP_K)
+
+async def search_documents(CollectionList: list, query: str, threshold: float = 0.25, top_k: int = SEARCH_TOP_K, query_embedding: list = None, lexical: list = None):
+    """Retrieve the best ``top_k`` chunks for ``query`` from the given collections.
+
+    In ``hybrid`` mode the vector ranking (cut at ``threshold``) is fused with a
+    BM25 ranking by reciprocal rank, and a confident BM25 result is returned
+    without embedding the query or searching vectors at all. Fused results are
+    scored by RRF, lexical-only ones by BM25. Callers that already ran
+    ``lexical_candidates`` pass its results as ``lexical``.
+    """
+    loop = asyncio.get_running_loop()
+    if not CollectionList:
+        return []
+    if lexical is None:
+        lexical = await lexical_candidates(CollectionList, query)
+    if lexical_confident(lexical):
+        return lexical[:top_k]
+    if query_embedding is None:
+        query_embedding = await embed_query(query)
+    with timed("vector_search"):
+        if get_vector_store().multi_collection_query:
+            results = await loop.run_in_executor(search_executor, _search_collections, CollectionList, query_embedding, top_k, threshold)
+        else:
+            per_collection = await asyncio.gather(*[
+                loop.run_in_executor(search_executor, _search_collection, collection_id, query_embedding, top_k, threshold)
+                for collection_id in CollectionList
+            ])
+            results = [result for results in per_collection for result in results]
+    if RETRIEVAL_MODE == "hybrid":
+        dense = sorted(results, key=lambda result: result["match"]["score"], reverse=True)
+        return reciprocal_rank_fusion([dense, lexical or []], top_k)
+    return heapq.nlargest(top_k, results, key=lambda result: result["match"]["score"])
@@ -0,0 +1,59 @@
+from sqlalchemy import event, inspect
+from collections import OrderedDict
+from dotenv import load_dotenv
+from threading import Lock
+from models import User
+import os
+import time
+
+load_dotenv()
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+class UserCache:
+    """Authenticated users keyed by JWT subject (username), with a TTL and LRU size cap.
+
+    Cached users are detached from their session, so only their column
+    attributes may be used, not lazy-loaded relationships.
+    """
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return user
+
+    def set(self, username, user):
+        with self._lock:
+            self._entries[username] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+user_cache = UserCache()
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_changed_user(mapper, connection, target):
+    user_cache.invalidate(target.username)
+    # A rename leaves the old subject cached as well.
+    history = inspect(target).attrs.username.history
+    for username in history.deleted or ():
+        user_cache.invalidate(username)
@@ -0,0 +1,523 @@
+from database import SessionLocal
+from models import Collection
+import json
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DIMENSION = 384
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+LOCAL_VECTOR_STORE_DIR = os.getenv("LOCAL_VECTOR_STORE_DIR", "./vector_store")
+PINECONE_SHARED_INDEX = os.getenv("PINECONE_SHARED_INDEX", "rag-chatbot")
+
+
+class VectorStore:
+    """Storage for the per-collection paragraph vectors used by retrieval.
+
+    Vectors carry their ``document_id`` in metadata, so one upsert may span several
+    documents. Matches are returned as ``{"document_id": int, "match": {"id", "score",
+    "metadata"}}`` so callers don't depend on the backend's response types.
+
+    Backends that set ``multi_collection_query`` can also search several
+    collections in one call through ``query_collections``.
+    """
+
+    multi_collection_query = False
+
+    def create_collection(self, collection_id):
+        raise NotImplementedError
+
+    def delete_collection(self, collection_id):
+        raise NotImplementedError
+
+    def upsert(self, collection_id, vectors):
+        raise NotImplementedError
+
+    def delete_document(self, collection_id, document_id):
+        raise NotImplementedError
+
+    def delete_vectors(self, collection_id, document_id, ids):
+        raise NotImplementedError
+
+    def update_metadata(self, collection_id, document_id, metadata_by_id):
+        """Merge new metadata fields into existing vectors, keeping their values."""
+        raise NotImplementedError
+
+    def query(self, collection_id, vector, top_k=5):
+        raise NotImplementedError
+
+    def query_collections(self, collection_ids, vector, top_k=5):
+        raise NotImplementedError
+
+
+def _create_pinecone_index(pc, name):
+    from pinecone import ServerlessSpec
+
+    pc.create_index(
+        name=name,
+        dimension=DIMENSION,
+        metric="cosine",
+        spec=ServerlessSpec(
+            cloud="aws",
+            region="us-east-1"
+        )
+    )
+
+
+class PineconeVectorStore(VectorStore):
+    """One serverless index per collection.
+
+    All documents of a collection share the default namespace; vector ids are
+    ``{document_id}#{chunk}`` and carry ``document_id`` metadata, so a search is
+    one query per collection and a document's vectors can be found by id prefix.
+    """
+
+    def __init__(self, api_key=None):
+        from pinecone import Pinecone
+
+        self.pc = Pinecone(api_key=api_key or os.getenv("PINECONE_API_KEY"))
+
+    def _index(self, collection_id):
+        return self.pc.Index(f"collection-{collection_id}")
+
+    def create_collection(self, collection_id):
+        _create_pinecone_index(self.pc, f"collection-{collection_id}")
+
+    def delete_collection(self, collection_id):
+        self.pc.delete_index(f"collection-{collection_id}")
+
+    def upsert(self, collection_id, vectors):
+        self._index(collection_id).upsert(vectors=vectors)
+
+    def delete_document(self, collection_id, document_id):
+        index = self._index(collection_id)
+        for ids in index.list(prefix=f"{document_id}#"):
+            if ids:
+                index.delete(ids=ids)
+
+    def delete_vectors(self, collection_id, document_id, ids):
+        index = self._index(collection_id)
+        for start in range(0, len(ids), 1000):
+            index.delete(ids=ids[start:start + 1000])
+
+    def update_metadata(self, collection_id, document_id, metadata_by_id):
+        index = self._index(collection_id)
+        for vector_id, metadata in metadata_by_id.items():
+            index.update(id=vector_id, set_metadata=metadata)
+
+    def query(self, collection_id, vector, top_k=5):
+        response = self._index(collection_id).query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+        )
+        return [
+            {
+                "document_id": int(match["metadata"]["document_id"]),
+                "match": {"id": match["id"], "score": match["score"], "metadata": match["metadata"]}
+            }
+            for match in response["matches"]
+        ]
+
+
+COLLECTION_OWNER_CACHE_SIZE = 65536
+
+_collection_owners = {}
+
+def collection_owner(collection_id, cached=True):
+    """User id owning a collection.
+
+    Owners never change, so searches use a per-process cache. Writes pass
+    ``cached=False``: a deleted collection's id may be reused, and another
+    worker's cache can't be told about the delete.
+    """
+    if cached and collection_id in _collection_owners:
+        return _collection_owners[collection_id]
+    db = SessionLocal()
+    try:
+        owner = db.query(Collection.user_id).filter(Collection.id == collection_id).scalar()
+    finally:
+        db.close()
+    if owner is None:
+        raise ValueError(f"Collection {collection_id} does not exist")
+    if len(_collection_owners) >= COLLECTION_OWNER_CACHE_SIZE:
+        _collection_owners.clear()
+    _collection_owners[collection_id] = owner
+    return owner
+
+def forget_collection_owner(collection_id):
+    _collection_owners.pop(collection_id, None)
+
+
+class SharedPineconeVectorStore(VectorStore):
+    """All collections in one serverless index, one namespace per user.
+
+    Vector ids are prefixed with ``{collection_id}/`` and carry ``collection_id``
+    and ``document_id`` metadata, so creating a collection needs no index
+    operation and a search over several collections of a user is a single
+    query filtered on ``collection_id``.
+    """
+
+    multi_collection_query = True
+
+    def __init__(self, api_key=None, index_name=PINECONE_SHARED_INDEX):
+        from pinecone import Pinecone
+
+        self.pc = Pinecone(api_key=api_key or os.getenv("PINECONE_API_KEY"))
+        if index_name not in self.pc.list_indexes().names():
+            _create_pinecone_index(self.pc, index_name)
+        self.index = self.pc.Index(index_name)
+
+    @staticmethod
+    def _namespace(collection_id, cached=True):
+        return f"user-{collection_owner(collection_id, cached)}"
+
+    def _delete_prefix(self, collection_id, prefix):
+        namespace = self._namespace(collection_id, cached=False)
+        for ids in self.index.list(prefix=prefix, namespace=namespace):
+            if ids:
+                self.index.delete(ids=ids, namespace=namespace)
+
+    def create_collection(self, collection_id):
+        forget_collection_owner(collection_id)
+
+    def delete_collection(self, collection_id):
+        """Must run while the collection row still exists: its owner picks the namespace."""
+        self._delete_prefix(collection_id, f"{collection_id}/")
+        forget_collection_owner(collection_id)
+
+    def upsert(self, collection_id, vectors):
+        vectors = [
+            {"id": f"{collection_id}/{v['id']}", "values": v["values"], "metadata": {**v["metadata"], "collection_id": collection_id}}
+            for v in vectors
+        ]
+        self.index.upsert(vectors=vectors, namespace=self._namespace(collection_id, cached=False))
+
+    def delete_document(self, collection_id, document_id):
+        self._delete_prefix(collection_id, f"{collection_id}/{document_id}#")
+
+    def delete_vectors(self, collection_id, document_id, ids):
+        namespace = self._namespace(collection_id, cached=False)
+        ids = [f"{collection_id}/{vector_id}" for vector_id in ids]
+        for start in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[start:start + 1000], namespace=namespace)
+
+    def update_metadata(self, collection_id, document_id, metadata_by_id):
+        namespace = self._namespace(collection_id, cached=False)
+        for vector_id, metadata in metadata_by_id.items():
+            self.index.update(id=f"{collection_id}/{vector_id}", set_metadata=metadata, namespace=namespace)
+
+    def query(self, collection_id, vector, top_k=5):
+        return [
+            {"document_id": result["document_id"], "match": result["match"]}
+            for result in self.query_collections([collection_id], vector, top_k)
+        ]
+
+    def query_collections(self, collection_ids, vector, top_k=5):
+        by_namespace = {}
+        for collection_id in collection_ids:
+            by_namespace.setdefault(self._namespace(collection_id), []).append(collection_id)
+        results = []
+        for namespace, ids in by_namespace.items():
+            response = self.index.query(
+                namespace=namespace,
+                vector=vector,
+                top_k=top_k,
+                include_metadata=True,
+                filter={"collection_id": {"$in": ids}},
+            )
+            for match in response["matches"]:
+                results.append({
+                    "collection_id": int(match["metadata"]["collection_id"]),
+                    "document_id": int(match["metadata"]["document_id"]),
+                    "match": {"id": match["id"].split("/", 1)[-1], "score": match["score"], "metadata": match["metadata"]}
+                })
+        return results
+
+
+class _LocalCollection:
+    """Vectors of one collection in a memory-mapped float32 matrix plus an append-only sidecar.
+
+    Rows are L2-normalised on write so cosine similarity is a single matrix-vector
+    product. Each row lives in a fixed slot of the matrix; deleting a row frees its
+    slot for reuse instead of moving the rows after it. The sidecar is a JSON-lines
+    log with one line per written (``{"slot", "id", "document_id", "metadata"}``)
+    or freed (``{"slot"}``) slot, so a write only appends the rows it touched. The
+    log is rewritten from the live rows once it is mostly superseded lines.
+    """
+
+    def __init__(self, root, collection_id):
+        self.matrix_path = os.path.join(root, f"collection-{collection_id}.f32")
+        self.log_path = os.path.join(root, f"collection-{collection_id}.jsonl")
+        self.lock = threading.RLock()
+        self.capacity = 0
+        self.matrix = None
+        self.rows = []
+        self.log_lines = 0
+        if os.path.exists(self.matrix_path):
+            self.capacity = os.path.getsize(self.matrix_path) // (4 * DIMENSION)
+            self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(self.capacity, DIMENSION))
+        legacy_path = os.path.join(root, f"collection-{collection_id}.json")
+        if os.path.exists(self.log_path):
+            self._replay()
+            self._reindex()
+        elif os.path.exists(legacy_path):
+            # Sidecar of earlier versions: the whole collection rewritten as one JSON document.
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                self.rows = json.load(f)["rows"]
+            self._reindex()
+            self._compact()
+            os.remove(legacy_path)
+        else:
+            self._reindex()
+
+    def _replay(self):
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # a write cut short by a crash; nothing after it was acknowledged
+                self.log_lines += 1
+                slot = entry["slot"]
+                if slot >= len(self.rows):
+                    self.rows.extend([None] * (slot + 1 - len(self.rows)))
+                self.rows[slot] = {key: entry[key] for key in ("id", "document_id", "metadata")} if "id" in entry else None
+
+    @property
+    def count(self):
+        return len(self.positions)
+
+    def _reindex(self):
+        while self.rows and self.rows[-1] is None:
+            self.rows.pop()
+        self.positions = {}
+        self.documents = {}
+        self.free = []
+        for slot, row in enumerate(self.rows):
+            if row is None:
+                self.free.append(slot)
+            else:
+                self.positions[(row["document_id"], row["id"])] = slot
+                self.documents.setdefault(row["document_id"], set()).add(slot)
+        self.free.reverse()
+        self.live = np.zeros(self.capacity, dtype=bool)
+        self.live[[slot for slot, row in enumerate(self.rows) if row is not None]] = True
+
+    def _ensure_capacity(self, needed):
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 64)
+        tmp_path = self.matrix_path + ".tmp"
+        matrix = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, DIMENSION))
+        if self.matrix is not None:
+            matrix[:len(self.rows)] = self.matrix[:len(self.rows)]
+        matrix.flush()
+        del matrix
+        self.matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self.capacity = capacity
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, DIMENSION))
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self.live)] = self.live
+        self.live = live
+
+    @staticmethod
+    def _entry(slot, row):
+        return json.dumps({"slot": slot, **row} if row is not None else {"slot": slot}) + "\n"
+
+    def _append(self, slots):
+        # The matrix goes to disk first, so a logged row never points at unwritten values.
+        if self.matrix is not None:
+            self.matrix.flush()
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.writelines(self._entry(slot, self.rows[slot] if slot < len(self.rows) else None) for slot in slots)
+        self.log_lines += len(slots)
+        if self.log_lines > max(1024, 2 * self.count):
+            self._compact()
+
+    def _compact(self):
+        if self.matrix is not None:
+            self.matrix.flush()
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(self._entry(slot, row) for slot, row in enumerate(self.rows) if row is not None)
+        os.replace(tmp_path, self.log_path)
+        self.log_lines = self.count
+
+    def save(self):
+        if not os.path.exists(self.log_path):
+            self._compact()
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values /= np.where(norms == 0, 1, norms)
+        new_keys = {(v["metadata"]["document_id"], v["id"]) for v in vectors} - self.positions.keys()
+        self._ensure_capacity(len(self.rows) + max(0, len(new_keys) - len(self.free)))
+        slots = []
+        for vector, row_values in zip(vectors, values):
+            document_id = vector["metadata"]["document_id"]
+            key = (document_id, vector["id"])
+            slot = self.positions.get(key)
+            row = {"id": vector["id"], "document_id": document_id, "metadata": vector["metadata"]}
+            if slot is None:
+                slot = self.free.pop() if self.free else len(self.rows)
+                if slot == len(self.rows):
+                    self.rows.append(row)
+                else:
+                    self.rows[slot] = row
+                self.positions[key] = slot
+                self.documents.setdefault(document_id, set()).add(slot)
+                self.live[slot] = True
+            else:
+                self.rows[slot] = row
+            self.matrix[slot] = row_values
+            slots.append(slot)
+        self._append(slots)
+
+    def update_metadata(self, document_id, metadata_by_id):
+        slots = []
+        for vector_id, metadata in metadata_by_id.items():
+            slot = self.positions.get((document_id, vector_id))
+            if slot is not None:
+                self.rows[slot]["metadata"] = {**self.rows[slot]["metadata"], **metadata}
+                slots.append(slot)
+        if slots:
+            self._append(slots)
+
+    def delete_document(self, document_id):
+        self._free(sorted(self.documents.get(document_id, ())))
+
+    def delete_vectors(self, document_id, ids):
+        self._free(sorted(self.positions[(document_id, vector_id)] for vector_id in set(ids) if (document_id, vector_id) in self.positions))
+
+    def _free(self, slots):
+        if not slots:
+            return
+        for slot in slots:
+            row = self.rows[slot]
+            del self.positions[(row["document_id"], row["id"])]
+            document_slots = self.documents[row["document_id"]]
+            document_slots.discard(slot)
+            if not document_slots:
+                del self.documents[row["document_id"]]
+            self.rows[slot] = None
+            self.live[slot] = False
+            self.free.append(slot)
+        self._append(slots)
+
+    def query(self, vector, top_k):
+        if self.count == 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        size = len(self.rows)
+        scores = self.matrix[:size] @ query
+        scores[~self.live[:size]] = -np.inf
+        k = min(top_k, self.count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "document_id": self.rows[i]["document_id"],
+                "match": {"id": self.rows[i]["id"], "score": float(scores[i]), "metadata": self.rows[i]["metadata"]}
+            }
+            for i in top
+        ]
+
+    def drop(self):
+        self.matrix = None
+        self.capacity = 0
+        self.rows = []
+        self.log_lines = 0
+        self._reindex()
+        for path in (self.matrix_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class LocalVectorStore(VectorStore):
+    """In-process engine for small tenants, offline development and tests.
+
+    Each collection has its own lock, so a write to one collection doesn't hold up
+    searches of the others.
+    """
+
+    def __init__(self, root=LOCAL_VECTOR_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._collections = {}
+
+    def _collection(self, collection_id):
+        with self._lock:
+            collection = self._collections.get(collection_id)
+            if collection is None:
+                collection = _LocalCollection(self.root, collection_id)
+                self._collections[collection_id] = collection
+            return collection
+
+    def create_collection(self, collection_id):
+        collection = self._collection(collection_id)
+        with collection.lock:
+            collection.save()
+
+    def delete_collection(self, collection_id):
+        collection = self._collection(collection_id)
+        with collection.lock:
+            collection.drop()
+        with self._lock:
+            self._collections.pop(collection_id, None)
+
+    def upsert(self, collection_id, vectors):
+        collection = self._collection(collection_id)
+        with collection.lock:
+            collection.upsert(vectors)
+
+    def delete_document(self, collection_id, document_id):
+        collection = self._collection(collection_id)
+        with collection.lock:
+            collection.delete_document(document_id)
+
+    def delete_vectors(self, collection_id, document_id, ids):
+        collection = self._collection(collection_id)
+        with collection.lock:
+            collection.delete_vectors(document_id, ids)
+
+    def update_metadata(self, collection_id, document_id, metadata_by_id):
+        collection = self._collection(collection_id)
+        with collection.lock:
+            collection.update_metadata(document_id, metadata_by_id)
+
+    def query(self, collection_id, vector, top_k=5):
+        collection = self._collection(collection_id)
+        with collection.lock:
+            return collection.query(vector, top_k)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_vector_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if VECTOR_STORE == "local":
+                    _store = LocalVectorStore()
+                elif VECTOR_STORE == "pinecone":
+                    _store = PineconeVectorStore()
+                elif VECTOR_STORE == "pinecone_shared":
+                    _store = SharedPineconeVectorStore()
+                else:
+                    raise ValueError(f"Unknown VECTOR_STORE backend: {VECTOR_STORE}")
+    return _store
@@ -1,16 +1,11 @@
-from sentence_transformers import SentenceTransformer
-
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-def split_into_paragraph(text):
-    return [p.strip() for p in text.split('\n') if p.strip()]
+from service.pinecone_service import get_embedding_model, split_into_paragraph
 
 def index_document(str):
     paragraphs = split_into_paragraph(str)
-    embeddings = model.encode(paragraphs)
+    embeddings = get_embedding_model().encode(paragraphs)
     vectors = [(f"{1}-{i}", embeddings[i].tolist(), {"document_id": 1, "paragraph_index": i}) for i in range(len(paragraphs))]
     print(vectors[0])
 
 docstr = "I am a student.\n I am going to work with you."
 
-index_document(docstr)
\ No newline at end of file
+index_document(docstr)
@@ -0,0 +1,22 @@
+import os
+import pytest
+import tempfile
+
+# The app reads its settings at import time, so point it at throwaway files before any test imports it.
+_workdir = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["LEXICAL_INDEX_PATH"] = os.path.join(_workdir, "lexical_index.db")
+os.environ["WARMUP_ON_STARTUP"] = "false"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Index into a throwaway local vector store with the benchmark's hashing embeddings."""
+    from benchmarks.stubs import HashingEmbeddingModel
+    from service import pinecone_service, vector_store
+
+    store = vector_store.LocalVectorStore(root=str(tmp_path))
+    monkeypatch.setattr(pinecone_service, "_model", HashingEmbeddingModel())
+    monkeypatch.setattr(pinecone_service, "_embedding_service", None)
+    monkeypatch.setattr(vector_store, "_store", store)
+    return store
@@ -0,0 +1,22 @@
+from datetime import datetime
+from service.answer_cache import AnswerCache
+
+
+def test_reused_collection_id_misses():
+    cache = AnswerCache(max_entries=10, ttl=60, threshold=0.9)
+    deleted = {5: (2, 1, datetime(2026, 1, 1))}
+    cache.store([1.0, 0.0], deleted, "answer", [{"paragraph": "private"}])
+
+    assert cache.lookup([1.0, 0.0], deleted) == ("answer", [{"paragraph": "private"}])
+    assert cache.lookup([1.0, 0.0], {5: (2, 7, datetime(2026, 2, 1))}) is None
+
+
+def test_deleted_collection_is_forgotten():
+    cache = AnswerCache(max_entries=10, ttl=60, threshold=0.9)
+    cache.store([1.0, 0.0], {5: (0, 1, None), 6: (0, 1, None)}, "both", [])
+    cache.store([1.0, 0.0], {6: (0, 1, None)}, "six", [])
+
+    cache.forget_collection(5)
+
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1.0, 0.0], {6: (0, 1, None)}) == ("six", [])
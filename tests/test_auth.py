@@ -0,0 +1,24 @@
+import asyncio
+import httpx
+
+
+def test_register_and_login():
+    from database import Base, engine
+    from main import app
+
+    Base.metadata.create_all(bind=engine)
+
+    async def main():
+        credentials = {"username": "alice", "password": "secret"}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            registered = await client.post("/auth/register", json={**credentials, "email": "alice@example.com"})
+            duplicate = await client.post("/auth/register", json={**credentials, "email": "alice@example.com"})
+            login = await client.post("/auth/login", json=credentials)
+            wrong = await client.post("/auth/login", json={**credentials, "password": "nope"})
+        return registered, duplicate, login, wrong
+
+    registered, duplicate, login, wrong = asyncio.run(main())
+    assert registered.status_code == 200
+    assert duplicate.status_code == 400
+    assert login.status_code == 200 and login.json()["user"]["username"] == "alice"
+    assert wrong.status_code == 401
@@ -0,0 +1,23 @@
+import asyncio
+from router import chat
+from service import lexical_index, pinecone_service
+
+
+def test_confident_lexical_hit_skips_the_cache_embed(monkeypatch):
+    hit = {"collection_id": 1, "document_id": 1, "match": {"id": "1#a", "score": 20.0, "metadata": {"text": "XJ-9000 manual"}}}
+
+    async def no_embed(query):
+        raise AssertionError("the query was embedded")
+
+    monkeypatch.setattr(chat, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(pinecone_service, "RETRIEVAL_MODE", "hybrid")
+    monkeypatch.setattr(lexical_index, "search", lambda collection_ids, query, top_k: [hit])
+    monkeypatch.setattr(chat, "embed_query", no_embed)
+    monkeypatch.setattr(pinecone_service, "embed_query", no_embed)
+
+    async def retrieve():
+        lexical, query_embedding, versions, cached = await chat.lookup_answer(None, "XJ-9000", [1])
+        assert query_embedding is None and cached is None
+        return await pinecone_service.search_documents([1], "XJ-9000", lexical=lexical)
+
+    assert asyncio.run(retrieve()) == [hit]
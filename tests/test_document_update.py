@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+from benchmarks.data import CorpusGenerator
+from service import lexical_index, pinecone_service
+
+
+def stored_rows(store, document):
+    collection = store._collection(document.collection_id)
+    return [collection.rows[slot] for slot in collection.documents.get(document.id, ())]
+
+
+def stored_chunks(store, document):
+    return [row["metadata"] for row in stored_rows(store, document)]
+
+
+def test_kept_chunks_get_their_new_offsets(store):
+    fields, _ = CorpusGenerator(seed=1).document(0, paragraphs=12)
+    document = SimpleNamespace(id=1, collection_id=1, title=fields["title"], content=fields["content"])
+    hashes = pinecone_service.index_document(document)
+
+    previous_content = document.content
+    document.content = "A new opening sentence.\n" + document.content
+    new_hashes = pinecone_service.update_document(document, hashes, previous_content)
+
+    assert set(hashes) & set(new_hashes)
+    chunks = stored_chunks(store, document)
+    assert len(chunks) == len(new_hashes)
+    for metadata in chunks:
+        assert document.content[metadata["start"]:metadata["end"]] == metadata["text"]
+    results = lexical_index.search([1], document.content, top_k=100)
+    assert len(results) == len(new_hashes)
+    for result in results:
+        metadata = result["match"]["metadata"]
+        assert document.content[metadata["start"]:metadata["end"]] == metadata["text"]
+
+
+def test_renamed_document_is_found_by_its_new_title(store):
+    fields, _ = CorpusGenerator(seed=2).document(1, paragraphs=4)
+    document = SimpleNamespace(id=2, collection_id=2, title="Zephyrtitle", content=fields["content"])
+    hashes = pinecone_service.index_document(document)
+
+    document.title = "Quokkaname"
+    pinecone_service.update_document(document, hashes, document.content, "Zephyrtitle")
+
+    assert lexical_index.search([2], "Zephyrtitle") == []
+    assert {result["document_id"] for result in lexical_index.search([2], "Quokkaname")} == {2}
+    assert {metadata["title"] for metadata in stored_chunks(store, document)} == {"Quokkaname"}
+
+
+def test_losing_a_concurrent_update_rebuilds_the_document(store):
+    from database import Base, SessionLocal, engine
+    from models import Document
+    from service.ingestion_service import reindex_document, store_manifest
+
+    Base.metadata.create_all(bind=engine)
+    generator = CorpusGenerator(seed=3)
+    db = SessionLocal()
+    try:
+        document = Document(title="t", content=generator.document(0)[0]["content"], collection_id=3)
+        db.add(document)
+        db.commit()
+        hashes = pinecone_service.index_document(document)
+        assert store_manifest(db, document.id, 0, hashes)
+        db.commit()
+
+        # Two updates read the same manifest; each adds the vectors of its own content.
+        first, second = generator.document(1)[0]["content"], generator.document(2)[0]["content"]
+        previous = document.content
+        document.content = first
+        first_hashes = pinecone_service.update_document(document, hashes, previous, "t")
+        document.content = second
+        second_hashes = pinecone_service.update_document(document, hashes, previous, "t")
+        db.commit()
+        assert store_manifest(db, document.id, 1, second_hashes)
+        db.commit()
+        assert not store_manifest(db, document.id, 1, first_hashes)
+        db.rollback()
+        assert {row["id"] for row in stored_rows(store, document)} > {f"{document.id}#{key}" for key in second_hashes}
+
+        manifest = reindex_document(db, document.id)
+        assert manifest == second_hashes
+        assert db.get(Document, document.id).index_version == 3
+        assert {f"{document.id}#{key}" for key in manifest} == {metadata["id"] for metadata in stored_rows(store, document)}
+    finally:
+        db.close()
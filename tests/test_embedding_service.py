@@ -0,0 +1,29 @@
+import time
+import numpy as np
+from service.embedding_service import EmbeddingService
+
+
+class SlowModel:
+    """Takes 1 ms per text and embeds each text as its length."""
+
+    def get_sentence_embedding_dimension(self):
+        return 1
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        time.sleep(0.001 * len(texts))
+        return np.array([[len(text)] for text in texts], dtype=np.float32)
+
+
+def test_queries_run_between_slices_of_a_bulk_request():
+    service = EmbeddingService(SlowModel(), max_batch_size=64, max_wait_ms=1)
+    texts = ["x" * (i % 7) for i in range(1000)]
+    bulk = service.submit(texts)
+    time.sleep(0.05)
+    start = time.monotonic()
+    query = service.encode("query")
+    waited = time.monotonic() - start
+
+    assert query.tolist() == [5.0]
+    assert not bulk.done()
+    assert waited < 0.3
+    assert bulk.result().ravel().tolist() == [len(text) for text in texts]
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from benchmarks.data import CorpusGenerator
+from database import Base, SessionLocal, engine
+from models import Document, IngestionJob
+from service import ingestion_service, lexical_index, pinecone_service
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def add_job(db, job_id, collection_id, status, documents=3, updated=None):
+    generator = CorpusGenerator(seed=len(job_id))
+    job = IngestionJob(id=job_id, collection_id=collection_id, user_id=1, status=status, total_documents=documents)
+    db.add(job)
+    db.add_all(Document(title=f"d{i}", content=generator.document(i)[0]["content"], collection_id=collection_id, status="pending", job_id=job_id) for i in range(documents))
+    db.commit()
+    if updated is not None:
+        db.query(IngestionJob).filter(IngestionJob.id == job_id).update({"updated_time": updated}, synchronize_session=False)
+        db.commit()
+
+
+def test_stale_running_job_is_resumed(db, store, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(ingestion_service, "submit_ingestion_job", submitted.append)
+    long_ago = datetime.now(timezone.utc) - timedelta(seconds=ingestion_service.INGEST_JOB_TIMEOUT * 2)
+    add_job(db, "stale-job", 11, "running", updated=long_ago)
+    add_job(db, "live-job", 12, "running")
+
+    assert ingestion_service.recover_ingestion_jobs() == ["stale-job"]
+    assert submitted == ["stale-job"]
+    assert not ingestion_service.claim_job(db, "live-job")
+
+    ingestion_service.run_ingestion_job("stale-job")
+    db.expire_all()
+    job = db.get(IngestionJob, "stale-job")
+    assert (job.status, job.indexed_documents) == ("completed", 3)
+    assert {document.status for document in db.query(Document).filter(Document.job_id == "stale-job")} == {"indexed"}
+
+
+def test_failed_batch_leaves_nothing_searchable(db, store, monkeypatch):
+    def fail(collection_id, vectors):
+        raise RuntimeError("upsert failed")
+
+    monkeypatch.setattr(store, "upsert", fail)
+    add_job(db, "failing-job", 13, "queued", documents=2)
+    topic_words = db.query(Document).filter(Document.job_id == "failing-job").first().content.split()[:3]
+
+    ingestion_service.run_ingestion_job("failing-job")
+    db.expire_all()
+    assert db.get(IngestionJob, "failing-job").status == "failed"
+    assert lexical_index.search([13], " ".join(topic_words)) == []
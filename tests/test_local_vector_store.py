@@ -0,0 +1,55 @@
+import json
+import os
+import numpy as np
+from service.vector_store import DIMENSION, LocalVectorStore
+
+
+def vector(document_id, chunk, seed):
+    values = np.random.default_rng(seed).standard_normal(DIMENSION).tolist()
+    return {"id": f"{document_id}#{chunk}", "values": values, "metadata": {"document_id": document_id, "text": chunk}}
+
+
+def ids(matches):
+    return {match["match"]["id"] for match in matches}
+
+
+def test_writes_survive_a_reload(tmp_path):
+    store = LocalVectorStore(root=str(tmp_path))
+    vectors = [vector(1, f"a{i}", i) for i in range(5)] + [vector(2, f"b{i}", 10 + i) for i in range(5)]
+    store.upsert(7, vectors)
+    store.delete_vectors(7, 1, ["1#a0", "1#a1"])
+    store.delete_document(7, 2)
+    store.upsert(7, [vector(3, "c0", 20)])
+
+    for reopened in (store, LocalVectorStore(root=str(tmp_path))):
+        matches = reopened.query(7, vectors[2]["values"], top_k=10)
+        assert ids(matches) == {"1#a2", "1#a3", "1#a4", "3#c0"}
+        assert matches[0]["match"]["id"] == "1#a2"
+    # The new row took a freed slot instead of growing the matrix.
+    assert len(store._collection(7).rows) == 10
+
+
+def test_old_json_sidecar_is_converted(tmp_path):
+    vectors = [vector(1, f"a{i}", i) for i in range(3)]
+    matrix = np.memmap(tmp_path / "collection-7.f32", dtype=np.float32, mode="w+", shape=(64, DIMENSION))
+    for i, v in enumerate(vectors):
+        values = np.asarray(v["values"], dtype=np.float32)
+        matrix[i] = values / np.linalg.norm(values)
+    matrix.flush()
+    del matrix
+    rows = [{"id": v["id"], "document_id": 1, "metadata": v["metadata"]} for v in vectors]
+    (tmp_path / "collection-7.json").write_text(json.dumps({"dimension": DIMENSION, "capacity": 64, "rows": rows}))
+
+    store = LocalVectorStore(root=str(tmp_path))
+    assert store.query(7, vectors[1]["values"], top_k=1)[0]["match"]["id"] == "1#a1"
+    assert not os.path.exists(tmp_path / "collection-7.json")
+    assert os.path.exists(tmp_path / "collection-7.jsonl")
+
+
+def test_truncated_log_line_is_ignored(tmp_path):
+    store = LocalVectorStore(root=str(tmp_path))
+    store.upsert(7, [vector(1, "a0", 0), vector(1, "a1", 1)])
+    with open(tmp_path / "collection-7.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"slot": 1, "id": "1#a')
+
+    assert ids(LocalVectorStore(root=str(tmp_path)).query(7, vector(1, "a0", 0)["values"], top_k=5)) == {"1#a0", "1#a1"}
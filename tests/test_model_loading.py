@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+
+def test_first_scheduler_load_runs_off_the_event_loop(monkeypatch):
+    from service import chatbot_service
+
+    def slow_get_scheduler():
+        time.sleep(0.3)
+        return "scheduler"
+
+    monkeypatch.setattr(chatbot_service, "_scheduler", None)
+    monkeypatch.setattr(chatbot_service, "get_scheduler", slow_get_scheduler)
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        scheduler = await chatbot_service.get_scheduler_async()
+        ticker.cancel()
+        return scheduler, ticks
+
+    scheduler, ticks = asyncio.run(main())
+    assert scheduler == "scheduler"
+    assert ticks > 5
+
+
+def test_scheduler_stats_do_not_load_the_model(monkeypatch):
+    from service import chatbot_service
+
+    def fail():
+        raise AssertionError("stats loaded the model")
+
+    monkeypatch.setattr(chatbot_service, "_scheduler", None)
+    monkeypatch.setattr(chatbot_service, "get_scheduler", fail)
+
+    stats = chatbot_service.scheduler_stats()
+    assert stats["requests"] == 0
+    assert stats["queue_depth"] == 0
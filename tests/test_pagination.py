@@ -0,0 +1,69 @@
+from datetime import datetime
+import asyncio
+import httpx
+import pytest
+import uuid
+from auth import get_current_user
+from database import Base, SessionLocal, engine
+from models import Collection, Document, History, User
+
+
+@pytest.fixture
+def client():
+    from main import app
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    name = uuid.uuid4().hex
+    user = User(username=name, email=f"{name}@example.com", password="x")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        yield user, app, db
+    finally:
+        app.dependency_overrides.clear()
+        db.close()
+
+
+def read_all(app, path, limit):
+    async def pages():
+        items, cursor = [], None
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            while True:
+                params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+                body = (await client.get(path, params=params)).json()
+                items.extend(item["id"] for item in body["items"])
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    return items
+
+    return asyncio.run(pages())
+
+
+def test_history_pages_cover_every_row_once(client):
+    user, app, db = client
+    # Server-default timestamps share a second; explicit ones are older despite higher ids.
+    db.add_all(History(user_id=user.id, query=f"q{i}", collection_ids=[], bot_response="a") for i in range(4))
+    db.commit()
+    db.add_all(History(user_id=user.id, query=f"old{i}", collection_ids=[], bot_response="a", created_at=datetime(2020, 1, 1 + i % 2)) for i in range(3))
+    db.commit()
+    expected = [row.id for row in db.query(History.id).filter(History.user_id == user.id).order_by(History.created_at.desc(), History.id.desc())]
+
+    for limit in (1, 2, 3):
+        assert read_all(app, "/chat/history", limit) == expected
+
+
+def test_collection_and_document_pages_cover_every_row_once(client):
+    user, app, db = client
+    collections = [Collection(name=f"c{i}", user_id=user.id) for i in range(5)]
+    db.add_all(collections)
+    db.commit()
+    db.add_all(Document(title=f"d{i}", content="x", collection_id=collections[0].id) for i in range(5))
+    db.commit()
+
+    assert read_all(app, "/collections/getall", 2) == sorted((c.id for c in collections), reverse=True)
+    documents = [d.id for d in db.query(Document.id).filter(Document.collection_id == collections[0].id)]
+    assert read_all(app, f"/collections/{collections[0].id}/documents/get", 2) == sorted(documents, reverse=True)
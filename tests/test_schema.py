@@ -0,0 +1,33 @@
+from sqlalchemy import create_engine, inspect, text
+
+OLD_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR, email VARCHAR, password VARCHAR, created_time DATETIME, updated_time DATETIME);
+CREATE TABLE collections (id INTEGER PRIMARY KEY, name VARCHAR, description VARCHAR, user_id INTEGER, created_time DATETIME, updated_time DATETIME);
+CREATE TABLE documents (id INTEGER PRIMARY KEY, title VARCHAR, content VARCHAR, collection_id INTEGER, created_time DATETIME, updated_time DATETIME);
+CREATE TABLE chat_histories (id INTEGER PRIMARY KEY, user_id INTEGER, query TEXT NOT NULL, collection_ids JSON NOT NULL, bot_response TEXT NOT NULL, created_at DATETIME);
+INSERT INTO collections (id, name, user_id) VALUES (1, 'c', 1);
+INSERT INTO documents (id, title, content, collection_id) VALUES (1, 't', 'body', 1);
+INSERT INTO chat_histories (id, user_id, query, collection_ids, bot_response) VALUES (1, 1, 'q', '[1, 2, 2]', 'a');
+"""
+
+
+def test_upgrade_schema_adds_columns_indexes_and_history_links(tmp_path):
+    from schema import upgrade_schema
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        for statement in OLD_SCHEMA.strip().split(";\n"):
+            connection.exec_driver_sql(statement)
+
+    changes = upgrade_schema(engine)
+
+    assert "collections.version" in changes["columns"]
+    assert {"documents.chunk_hashes", "documents.index_version", "documents.job_id", "documents.status", "documents.indexed_at"} <= set(changes["columns"])
+    assert "ix_chat_histories_user_id_created_at" in changes["indexes"]
+    assert changes["history_links"] == 2
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT version FROM collections")).scalar() == 0
+        links = connection.execute(text("SELECT collection_id FROM chat_history_collections ORDER BY collection_id")).scalars().all()
+    assert links == [1, 2]
+    assert "ix_documents_collection_id_id" in {index["name"] for index in inspect(engine).get_indexes("documents")}
+    assert upgrade_schema(engine) == {"columns": [], "indexes": []}
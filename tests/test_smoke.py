@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from sqlalchemy import text
+
+
+def test_app_imports():
+    import main
+
+    assert main.app.routes
+
+
+def test_async_engine_connects():
+    from database import async_engine
+
+    async def select_one():
+        async with async_engine.connect() as connection:
+            return (await connection.execute(text("SELECT 1"))).scalar()
+
+    assert asyncio.run(select_one()) == 1
+
+
+def test_database_url():
+    from database import DEFAULT_DATABASE_URL, database_url
+
+    assert database_url(None) == DEFAULT_DATABASE_URL
+    assert database_url("YOUR_DATABASE_URL") == DEFAULT_DATABASE_URL
+    assert database_url("postgresql://user:secret@db/app") == "postgresql+psycopg2://user:secret@db/app"
+    assert database_url("mysql+mysqldb://user@db/app") == "mysql+mysqldb://user@db/app"
+    with pytest.raises(RuntimeError, match="not a valid database URL"):
+        database_url("not a url")